@@ -4,31 +4,62 @@ from abc import ABC
 from typing import (
     Any,
     Dict,
+    Iterable,
+    List,
+    Tuple,
     cast,
 )
 from uuid import UUID
 
-from eventsourcing.application import (
-    Application,
-    AggregateNotFoundError,
-)
+from eventsourcing.application import AggregateNotFoundError
+from eventsourcing.persistence import IntegrityError
+
+from seedwork.aio import AsyncApplication
+from seedwork.cache import CachingApplication
 
 from .domainmodel import DogAggregate
 
+class DogSchoolBatchError(Exception):
+    """
+    Raised by a batch command of DogSchool when some of its items failed, with
+    their errors by the index of the item. The other items are done.
+    """
+
+    def __init__(self, failures: Dict[int, Exception]):
+        super().__init__(failures)
+        self.failures = failures
+
+
+class DogsNotRegisteredError(DogSchoolBatchError):
+    pass
+
+
+class TricksNotAddedError(DogSchoolBatchError):
+    pass
+
+
 class IDogSchool(ABC):
     @abc.abstractmethod
     def register_dog(self, name: str) -> UUID:
         ...
 
+    @abc.abstractmethod
+    def register_dogs(self, names: Iterable[str]) -> List[UUID]:
+        ...
+
     @abc.abstractmethod
     def add_trick(self, dog_name: str, trick: str) -> None:
         ...
 
+    @abc.abstractmethod
+    def add_tricks(self, tricks: Iterable[Tuple[str, str]]) -> None:
+        ...
+
     @abc.abstractmethod
     def get_dog(self, dog_name: str) -> Dict[str, Any]:
         ...
 
-class DogSchool(IDogSchool, Application):
+class DogSchool(IDogSchool, CachingApplication):
     is_snapshotting_enabled = True
     snapshotting_intervals = {DogAggregate: 100}
 
@@ -40,12 +71,76 @@ class DogSchool(IDogSchool, Application):
             self.save(dog)
         return dog.id
 
+    def register_dogs(self, names: Iterable[str]) -> List[UUID]:
+        """
+        Registers the dogs which are not registered yet with a single save.
+        Returns the dog ids in the order of the names.
+
+        If the save fails, as when one of the dogs is registered concurrently, the
+        dogs are saved one by one. A dog registered meanwhile counts as registered,
+        as with register_dog, the other failures raise a DogsNotRegisteredError
+        once the rest of the dogs are saved.
+        """
+        dog_ids = []
+        new_dogs: Dict[UUID, Tuple[int, str]] = {}
+        for index, name in enumerate(names):
+            dog_id = DogAggregate.create_id(name)
+            dog_ids.append(dog_id)
+            if dog_id not in new_dogs and not self._is_registered(dog_id):
+                new_dogs[dog_id] = index, name
+        try:
+            self.save(*(DogAggregate(name) for _, name in new_dogs.values()))
+        except IntegrityError:
+            failures: Dict[int, Exception] = {}
+            for dog_id, (index, name) in new_dogs.items():
+                try:
+                    self.save(DogAggregate(name))
+                except IntegrityError as e:
+                    if not self._is_registered(dog_id):
+                        failures[index] = e
+            if failures:
+                raise DogsNotRegisteredError(failures)
+        return dog_ids
+
     def add_trick(self, dog_name: str, trick: str) -> None:
         dog_id = DogAggregate.create_id(dog_name)
         dog = cast(DogAggregate, self.repository.get(dog_id))
         dog.add_trick(trick)
         self.save(dog)
 
+    def add_tricks(self, tricks: Iterable[Tuple[str, str]]) -> None:
+        """
+        Adds (dog name, trick) pairs. Each dog is loaded once and all new events
+        are recorded with a single save.
+
+        If the save fails, as when one of the dogs is changed concurrently, the
+        tricks of each dog are added again to the dog as it is now and saved one
+        dog at a time. A trick which can't be added doesn't abort the batch, the
+        failures raise a TricksNotAddedError once the rest of the tricks are added.
+        """
+        dogs: Dict[str, DogAggregate] = {}
+        added: Dict[str, List[Tuple[int, str]]] = {}
+        failures: Dict[int, Exception] = {}
+        for index, (dog_name, trick) in enumerate(tricks):
+            try:
+                if dog_name not in dogs:
+                    dogs[dog_name] = self.repository.get(DogAggregate.create_id(dog_name))
+                dogs[dog_name].add_trick(trick)
+            except (AggregateNotFoundError, ValueError) as e:
+                failures[index] = e
+            else:
+                added.setdefault(dog_name, []).append((index, trick))
+        try:
+            self.save(*dogs.values())
+        except IntegrityError:
+            for dog_name, dog_tricks in added.items():
+                try:
+                    self._add_dog_tricks(dog_name, dog_tricks, failures)
+                except IntegrityError as e:
+                    failures.update((index, e) for index, _ in dog_tricks if index not in failures)
+        if failures:
+            raise TricksNotAddedError(failures)
+
     def get_dog(self, dog_name: str) -> Dict[str, Any]:
         dog_id = DogAggregate.create_id(dog_name)
         dog = self.repository.get(dog_id)
@@ -53,3 +148,32 @@ class DogSchool(IDogSchool, Application):
 
     def get_snapshot(self, dog_id: UUID):
         return self.snapshots.get(dog_id)
+
+    def _is_registered(self, dog_id: UUID) -> bool:
+        return any(True for _ in self.events.get(dog_id, limit=1))
+
+    def _add_dog_tricks(self, dog_name: str, tricks: List[Tuple[int, str]], failures: Dict[int, Exception]) -> None:
+        dog = cast(DogAggregate, self.repository.get(DogAggregate.create_id(dog_name)))
+        for index, trick in tricks:
+            try:
+                dog.add_trick(trick)
+            except ValueError as e:
+                failures[index] = e
+        self.save(dog)
+
+
+class AsyncDogSchool(AsyncApplication[DogSchool]):
+    async def register_dog(self, name: str) -> UUID:
+        return await self.run(self.app.register_dog, name)
+
+    async def register_dogs(self, names: Iterable[str]) -> List[UUID]:
+        return await self.run(self.app.register_dogs, list(names))
+
+    async def add_trick(self, dog_name: str, trick: str) -> None:
+        return await self.run(self.app.add_trick, dog_name, trick)
+
+    async def add_tricks(self, tricks: Iterable[Tuple[str, str]]) -> None:
+        return await self.run(self.app.add_tricks, list(tricks))
+
+    async def get_dog(self, dog_name: str) -> Dict[str, Any]:
+        return await self.run(self.app.get_dog, dog_name)
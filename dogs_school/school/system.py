@@ -1,4 +1,13 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import singledispatch
+from itertools import (
+    chain,
+    islice,
+)
 from uuid import (
+    UUID,
     uuid5,
     NAMESPACE_URL,
 )
@@ -7,44 +16,124 @@ from eventsourcing.application import (
     ProcessingEvent,
     AggregateNotFoundError,
 )
-from eventsourcing.dispatch import singledispatchmethod
+from eventsourcing.cipher import AESCipher
 from eventsourcing.domain import (
     Aggregate,
     event,
     DomainEventProtocol,
 )
+from eventsourcing.persistence import (
+    InfrastructureFactory,
+    IntegrityError,
+    Mapper,
+    StoredEvent,
+    Tracking,
+    Transcoding,
+)
 from eventsourcing.system import ProcessApplication
+from eventsourcing.utils import (
+    Environment,
+    get_topic,
+    resolve_topic,
+)
 
 from school.domainmodel import DogAggregate
+from seedwork.batching import BatchingFollower
 
 
-class Counters(ProcessApplication):
-    @singledispatchmethod
-    def policy(self, domain_event, process_event):
-        """Default policy"""
-        ...
+class Counters(BatchingFollower, ProcessApplication):
+    """
+    Counts dog names and tricks. The increments of a batch are summed per name,
+    and each counter is read once and changed by one event per batch, recorded
+    with the tracking position of the batch.
+    """
+    CATCH_UP_WORKERS = 'CATCH_UP_WORKERS'
+    CATCH_UP_PAGE_SIZE = 'CATCH_UP_PAGE_SIZE'
 
-    @policy.register
-    def _(self, domain_event: DogAggregate.Registered, process_event):
-        name = domain_event.name
-        try:
-            counter_id = Counter.create_id(name)
-            counter = self.repository.get(counter_id)
-        except AggregateNotFoundError:
-            counter = Counter(name)
-        counter.increment()
-        process_event.collect_events(counter)
+    def __init__(self, env=None):
+        super().__init__(env)
+        self._deltas: dict[str, int] = {}
 
-    @policy.register
-    def _(self, domain_event: DogAggregate.TrickAdded, process_event):
-        trick = domain_event.trick_name
-        try:
-            counter_id = Counter.create_id(trick)
-            counter = self.repository.get(counter_id)
-        except AggregateNotFoundError:
-            counter = Counter(trick)
-        counter.increment()
-        process_event.collect_events(counter)
+    def catch_up(self, leader_name: str) -> None:
+        """
+        Processes the unseen notifications of the leader in pages of CATCH_UP_PAGE_SIZE.
+        The notifications of a page are partitioned by originator id and counted in a pool
+        of CATCH_UP_WORKERS processes. Counts are commutative, so the counts of the
+        partitions are summed and recorded as one batch with the tracking of the last
+        notification of the page, after every partition is done.
+
+        The processing lock is held for the whole catch-up, so events are not processed
+        meanwhile by this application. When the tracking position moved on during a page,
+        as when another process follows the same leader, the page is not recorded and
+        IntegrityError is raised: catch up before the application is started in a runner.
+
+        The workers are spawned rather than forked, and only construct the mapper of
+        the leader, not an application with its own recorder and connections.
+        """
+        workers = int(self.env.get(self.CATCH_UP_WORKERS, str(os.cpu_count() or 1)))
+        page_size = int(self.env.get(self.CATCH_UP_PAGE_SIZE, '100000'))
+        leader_env = self.construct_env(leader_name, self.env)
+        # Only string settings go to the workers, the env may hold objects which don't pickle.
+        mapper_env = {
+            key: leader_env.get(key)
+            for key in (InfrastructureFactory.CIPHER_TOPIC, AESCipher.CIPHER_KEY, InfrastructureFactory.COMPRESSOR_TOPIC)
+            if leader_env.get(key)
+        }
+        mapper = self.mappers[leader_name]
+        with self.processing_lock:
+            self.flush()
+            position = self.recorder.max_tracking_id(leader_name)
+            notifications = chain.from_iterable(self.pull_notifications(leader_name, start=position + 1))
+            with ProcessPoolExecutor(
+                    workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_catch_up_worker,
+                    initargs=(
+                        leader_name,
+                        mapper_env,
+                        get_topic(type(mapper)),
+                        list(mapper.transcoder.names.values()),
+                    ),
+            ) as executor:
+                while page := list(islice(notifications, page_size)):
+                    partitions: list[list] = [[] for _ in range(workers)]
+                    for notification in self.filter_received_notifications(page):
+                        # Plain tuples are much cheaper to pickle than notifications with UUIDs.
+                        partitions[notification.originator_id.int % workers].append((
+                            notification.originator_id.bytes,
+                            notification.originator_version,
+                            notification.topic,
+                            notification.state,
+                        ))
+                    counted = list(executor.map(_count_partition, partitions))
+                    if self.recorder.max_tracking_id(leader_name) != position:
+                        raise IntegrityError(
+                            f'Notifications of {leader_name} after {position} were processed during the catch-up'
+                        )
+                    for deltas in counted:
+                        for name, count in deltas.items():
+                            self._deltas[name] = self._deltas.get(name, 0) + count
+                    position = page[-1].id
+                    self._batch = ProcessingEvent(Tracking(leader_name, position))
+                    self.flush()
+
+    def write_batch(self, processing_event: ProcessingEvent) -> None:
+        deltas, self._deltas = self._deltas, {}
+        for name, count in deltas.items():
+            try:
+                counter = self.repository.get(Counter.create_id(name))
+            except AggregateNotFoundError:
+                counter = Counter(name)
+            if count == 1:
+                counter.increment()
+            else:
+                counter.increment_by(count)
+            processing_event.collect_events(counter)
+
+    def policy(self, domain_event, process_event):
+        name = counted_name(domain_event)
+        if name is not None:
+            self._deltas[name] = self._deltas.get(name, 0) + 1
 
     def get_count(self, trick):
         counter_id = Counter.create_id(trick)
@@ -54,6 +143,52 @@ class Counters(ProcessApplication):
             return 0
         return counter.count
 
+
+@singledispatch
+def counted_name(domain_event) -> str | None:
+    """The name which Counters counts for the event, if any."""
+    return None
+
+
+@counted_name.register
+def _(domain_event: DogAggregate.Registered) -> str | None:
+    return domain_event.name
+
+
+@counted_name.register
+def _(domain_event: DogAggregate.TrickAdded) -> str | None:
+    return domain_event.trick_name
+
+
+_catch_up_mapper: Mapper | None = None
+
+
+def _init_catch_up_worker(leader_name: str, env: dict, mapper_topic: str, transcodings: list[Transcoding]) -> None:
+    """
+    Constructs the same mapper as Follower.follow() for the leader, with the cipher and
+    compressor settings of its env, but without recorders: the in-memory factory opens
+    no connections.
+    """
+    global _catch_up_mapper
+    factory = InfrastructureFactory.construct(
+        Environment(leader_name, {**env, InfrastructureFactory.PERSISTENCE_MODULE: 'eventsourcing.popo'})
+    )
+    transcoder = factory.transcoder()
+    for transcoding in transcodings:
+        transcoder.register(transcoding)
+    _catch_up_mapper = factory.mapper(transcoder, mapper_class=resolve_topic(mapper_topic))
+
+
+def _count_partition(notifications: list[tuple]) -> dict[str, int]:
+    deltas: dict[str, int] = {}
+    for originator_id, originator_version, topic, state in notifications:
+        stored_event = StoredEvent(UUID(bytes=originator_id), originator_version, topic, state)
+        name = counted_name(_catch_up_mapper.to_domain_event(stored_event))
+        if name is not None:
+            deltas[name] = deltas.get(name, 0) + 1
+    return deltas
+
+
 class Counter(Aggregate):
     def __init__(self, name):
         self.name = name
@@ -67,6 +202,10 @@ class Counter(Aggregate):
     def increment(self):
         self.count += 1
 
+    @event('IncrementedBy')
+    def increment_by(self, n: int):
+        self.count += n
+
 
 class Printers(ProcessApplication):
 
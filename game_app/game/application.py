@@ -1,12 +1,13 @@
 from uuid import UUID
 
-from eventsourcing.application import Application
 from eventsourcing.persistence import IntegrityError
 
+from seedwork.aio import AsyncApplication
+from seedwork.cache import CachingApplication
 from game.domainmodel import Player
 
 
-class Game(Application):
+class Game(CachingApplication):
     snapshotting_intervals = {Player: 100}
     is_snapshotting_enabled = True
 
@@ -25,3 +26,14 @@ class Game(Application):
 
     def get(self, player_id: UUID) -> Player:
         return self.repository.get(player_id)
+
+
+class AsyncGame(AsyncApplication[Game]):
+    async def register(self, name: str) -> UUID:
+        return await self.run(self.app.register, name)
+
+    async def add_score(self, player_id: UUID, score: int) -> None:
+        return await self.run(self.app.add_score, player_id, score)
+
+    async def get(self, player_id: UUID) -> Player:
+        return await self.run(self.app.get, player_id)
@@ -1,6 +1,9 @@
+import heapq
 from functools import singledispatchmethod
+from itertools import islice
 
 import sqlalchemy as sa
+from sortedcontainers import SortedList
 from uuid import (
     UUID,
     uuid5,
@@ -14,40 +17,120 @@ from eventsourcing.application import (
 from eventsourcing.domain import (
     DomainEventProtocol,
     Aggregate,
+    Snapshot,
     event,
 )
-from eventsourcing.system import (
-    ProcessApplication,
-    Follower,
-)
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import ProcessApplication
 from sqlalchemy import Engine
 
 from game.domainmodel import Player
+from seedwork.batching import BatchingFollower
+from seedwork.snapshots import SnapshottingApplication
 
 
 class HighScoreTable(Aggregate):
+    """
+    Keeps `ranking` sorted by (-score, player_id) next to the scores, so reading
+    the top and the rank of a player does not sort the whole table. The ranking
+    is a SortedList, which updates a score in O(log n), and a plain list in the
+    snapshot state.
+    """
+    class_version = 2
+
+    class Snapshot(Snapshot):
+        @classmethod
+        def take(cls, aggregate: 'HighScoreTable') -> 'HighScoreTable.Snapshot':
+            snapshot = super().take(aggregate)
+            snapshot.state['ranking'] = list(aggregate.ranking)
+            return snapshot
+
+        def mutate(self, _: None) -> 'HighScoreTable':
+            table = super().mutate(None)
+            # Transcoded state gives lists back, the ranking must compare as tuples.
+            table.scores = {player_id: tuple(value) for player_id, value in table.scores.items()}
+            table.ranking = SortedList(tuple(key) for key in table.ranking)
+            return table
+
     def __init__(self):
         self.scores: dict[str, tuple[str, int]] = {}
+        self.ranking: SortedList = SortedList()
 
     @classmethod
     def create_id(cls) -> UUID:
         return uuid5(NAMESPACE_URL, '/high_score_table')
 
+    @staticmethod
+    def upcast_v1_v2(state: dict) -> None:
+        state['ranking'] = sorted((-score, player_id) for player_id, (_, score) in state['scores'].items())
+
     @event('PlayerRegistered')
     def register(self, player_id: UUID, name: str):
+        if str(player_id) in self.scores:
+            self._unrank(str(player_id))
         self.scores[str(player_id)] = (name, 0)
+        self.ranking.add((0, str(player_id)))
 
     @event("HighScoreTableUpdated")
     def increment_score(self, player_id: UUID, score: int):
-        self.scores[str(player_id)] = self.scores[str(player_id)][0], self.scores[str(player_id)][1] + score
+        name, old_score = self._unrank(str(player_id))
+        self.scores[str(player_id)] = name, old_score + score
+        self.ranking.add((-(old_score + score), str(player_id)))
+
+    def get_top(self, limit: int | None = None):
+        return [self.scores[player_id] for _, player_id in self.ranking.islice(stop=limit)]
+
+    def get_rank(self, player_id: UUID) -> int | None:
+        if str(player_id) not in self.scores:
+            return None
+        return self.count_ahead(player_id, self.scores[str(player_id)][1]) + 1
+
+    def count_ahead(self, player_id: UUID, score: int) -> int:
+        return self.ranking.bisect_left((-score, str(player_id)))
+
+    def _unrank(self, player_id: str) -> tuple[str, int]:
+        name, score = self.scores[player_id]
+        self.ranking.remove((-score, player_id))
+        return name, score
+
 
-    def get_top(self):
-        return sorted(self.scores.values(), key=lambda x: x[1], reverse=True)
+class HighScoreTableShard(HighScoreTable):
+    """
+    One partition of the high score table. Players are spread over the shards
+    by their id, so every shard has its own version sequence and snapshots.
+    The number of shards is recorded when a shard is created (None for shards
+    created before it was).
+    """
 
+    def __init__(self, shard: int, shards: int | None = None):
+        super().__init__()
+        self.shard = shard
+        self.shards = shards
+
+    @classmethod
+    def create_id(cls, shard: int) -> UUID:
+        return uuid5(NAMESPACE_URL, f'/high_score_table/{shard}')
+
+    @classmethod
+    def get_shard(cls, player_id: UUID, shards: int) -> int:
+        return player_id.int % shards
+
+
+class HallOfFame(SnapshottingApplication, ProcessApplication):
+    """
+    Ranks the players in HIGH_SCORE_SHARDS high score tables. The players of a
+    stored table stay in it, so the number of shards can't change without a rebuild
+    of the tables: OSError is raised when it differs from the stored one.
+    """
+    HIGH_SCORE_SHARDS = 'HIGH_SCORE_SHARDS'
 
-class HallOfFame(ProcessApplication):
     is_snapshotting_enabled = True
-    snapshotting_intervals = {HighScoreTable: 100, Player: 100}
+    snapshotting_intervals = {HighScoreTable: 100, HighScoreTableShard: 100, Player: 100}
+
+    def __init__(self, env: dict | None = None):
+        super().__init__(env)
+        self.shards = int(self.env.get(self.HIGH_SCORE_SHARDS, '1'))
+        self._check_shards()
 
     @singledispatchmethod
     def policy(self, domain_event: DomainEventProtocol, processing_event: ProcessingEvent) -> None:
@@ -55,10 +138,7 @@ class HallOfFame(ProcessApplication):
 
     @policy.register
     def _(self, domain_event: Player.Registered, processing_event: ProcessingEvent) -> None:
-        try:
-            table = self.repository.get(HighScoreTable.create_id())
-        except AggregateNotFoundError:
-            table = HighScoreTable()
+        table = self._get_table(domain_event.originator_id)
         table.register(player_id=domain_event.originator_id, name=domain_event.name)
         processing_event.collect_events(table)
 
@@ -66,26 +146,226 @@ class HallOfFame(ProcessApplication):
     def _(self, domain_event: Player.AddedScore, processing_event: ProcessingEvent) -> None:
         score = domain_event.points
         player_id = domain_event.originator_id
-        try:
-            table = self.repository.get(HighScoreTable.create_id())
-        except AggregateNotFoundError:
-            table = HighScoreTable()
+        table = self._get_table(player_id)
         table.increment_score(player_id, score)
         processing_event.collect_events(table)
 
-    def get_top(self):
+    def get_top(self, limit: int | None = None):
+        tops = [table.get_top(limit) for table in self._get_tables()]
+        return list(islice(heapq.merge(*tops, key=lambda x: x[1], reverse=True), limit))
+
+    def get_rank(self, player_id: UUID) -> int | None:
+        tables = self._get_tables()
+        table = tables[HighScoreTableShard.get_shard(player_id, len(tables))]
+        if str(player_id) not in table.scores:
+            return None
+        _, score = table.scores[str(player_id)]
+        return sum(table.count_ahead(player_id, score) for table in tables) + 1
+
+    def _get_tables(self) -> list[HighScoreTable]:
+        """
+        The table of every shard in shard order, new ones for the shards without players.
+        """
+        return [self._get_shard_table(shard) for shard in range(max(self.shards, 1))]
+
+    def _get_table(self, player_id: UUID) -> HighScoreTable:
+        return self._get_shard_table(HighScoreTableShard.get_shard(player_id, max(self.shards, 1)))
+
+    def _get_shard_table(self, shard: int) -> HighScoreTable:
+        if self.shards <= 1:
+            try:
+                return self.repository.get(HighScoreTable.create_id())
+            except AggregateNotFoundError:
+                return HighScoreTable()
         try:
-            table = self.repository.get(HighScoreTable.create_id())
+            table = self.repository.get(HighScoreTableShard.create_id(shard))
         except AggregateNotFoundError:
-            return []
-        return table.get_top()
+            return HighScoreTableShard(shard, self.shards)
+        if getattr(table, 'shards', None) not in (None, self.shards):
+            self._raise_shards_changed(table.shards)
+        return table
 
+    def _check_shards(self) -> None:
+        """
+        Compares HIGH_SCORE_SHARDS with the number of shards of the first stored table.
+        """
+        if self.shards <= 1:
+            created = self._get_created(HighScoreTableShard.create_id(0))
+            if created is not None:
+                self._raise_shards_changed(getattr(created, 'shards', None))
+            return
+        if self._get_created(HighScoreTable.create_id()) is not None:
+            self._raise_shards_changed(1)
+        for shard in range(self.shards):
+            created = self._get_created(HighScoreTableShard.create_id(shard))
+            if created is not None:
+                if getattr(created, 'shards', None) not in (None, self.shards):
+                    self._raise_shards_changed(created.shards)
+                return
 
-class HallOfFameMaterialize(Follower):
+    def _get_created(self, table_id: UUID) -> DomainEventProtocol | None:
+        return next(iter(self.events.get(table_id, limit=1)), None)
+
+    def _raise_shards_changed(self, stored: int | None) -> None:
+        raise OSError(
+            f"{self.HIGH_SCORE_SHARDS} is {self.shards} but the high score tables are stored with "
+            f"{stored or 'a different number of'} shards, rebuild them to change it"
+        )
+
+
+class HallOfFameMaterialize(BatchingFollower):
+    """
+    Buffers the high score changes of a batch and writes them with one upsert per
+    player, before the tracking position of the batch is recorded.
+
+    The scores are added to the stored ones, so a batch must not be written twice.
+    The position of the last notification written is kept in high_score_tracking,
+    in the same transaction as the rows, and the notifications up to it are skipped
+    when they are processed again, as after a crash before the tracking was recorded.
+    """
+    REBUILD_CHUNK_SIZE = 10000
 
     def __init__(self, env: dict):
         self.engine: Engine = env['postgresql_engine']  # todo: should be smth like a dishka container
         super().__init__(env)
+        self._rows: dict[str, dict] = {}
+        self._written: dict[str, int] = {}
+        with self.engine.begin() as conn:
+            conn.execute(sa.text(
+                """
+                CREATE TABLE IF NOT EXISTS high_score_tracking (
+                    application_name TEXT PRIMARY KEY,
+                    notification_id BIGINT NOT NULL
+                )
+                """
+            ))
+
+    def process_event(self, domain_event: DomainEventProtocol, tracking: Tracking) -> None:
+        with self.processing_lock:
+            if tracking.notification_id > self._get_written(tracking.application_name):
+                super().process_event(domain_event, tracking)
+
+    def write_batch(self, processing_event: ProcessingEvent) -> None:
+        rows, self._rows = self._rows, {}
+        if not rows:
+            return
+        tracking = processing_event.tracking
+        with self.engine.begin() as conn:
+            conn.execute(
+                sa.text(
+                    """
+                    INSERT INTO 
+                    high_score (name, player_id, score) 
+                    VALUES (:name, :player_id, :score)
+                    ON CONFLICT (player_id) DO UPDATE
+                    SET name = COALESCE(EXCLUDED.name, high_score.name),
+                        score = high_score.score + EXCLUDED.score
+                    """
+                ), list(rows.values())
+            )
+            self._write_tracking(conn, tracking)
+
+    def _get_written(self, leader_name: str) -> int:
+        if leader_name not in self._written:
+            with self.engine.connect() as conn:
+                self._written[leader_name] = conn.execute(
+                    sa.text("SELECT notification_id FROM high_score_tracking WHERE application_name = :name"),
+                    {'name': leader_name},
+                ).scalar() or 0
+        return self._written[leader_name]
+
+    def _write_tracking(self, conn: sa.Connection, tracking: Tracking) -> None:
+        conn.execute(
+            sa.text(
+                """
+                INSERT INTO high_score_tracking (application_name, notification_id)
+                VALUES (:name, :notification_id)
+                ON CONFLICT (application_name) DO UPDATE
+                SET notification_id = EXCLUDED.notification_id
+                """
+            ), {'name': tracking.application_name, 'notification_id': tracking.notification_id}
+        )
+        self._written[tracking.application_name] = tracking.notification_id
+
+    def rebuild(self, leader_name: str) -> None:
+        """
+        Rebuilds the high_score table from the whole notification log of the leader.
+
+        The events are folded in memory into the final row of every player in one
+        streaming pass. The rows are bulk loaded into a high_score_rebuild shadow table
+        (COPY on psycopg, batched inserts otherwise), which replaces high_score in one
+        transaction with the position of the last notification in high_score_tracking.
+        Then the position is recorded, so live processing resumes after it.
+        """
+        with self.processing_lock:
+            self.flush()
+            last_id = 0
+            try:
+                for notifications in self.pull_notifications(leader_name, start=1):
+                    for domain_event, tracking in self.convert_notifications(leader_name, notifications):
+                        # Events collected by the policy were recorded by the live processing.
+                        self.policy(domain_event, ProcessingEvent(tracking))
+                        last_id = tracking.notification_id
+                rows = self._rows
+            finally:
+                self._rows = {}
+            with self.engine.begin() as conn:
+                high_score = self._create_shadow_table(conn)
+                self._load_shadow_table(conn, list(rows.values()))
+                conn.execute(sa.text("DROP TABLE IF EXISTS high_score_old"))
+                conn.execute(sa.text("ALTER TABLE high_score RENAME TO high_score_old"))
+                conn.execute(sa.text("ALTER TABLE high_score_rebuild RENAME TO high_score"))
+                conn.execute(sa.text("DROP TABLE high_score_old"))
+                self._restore_names(conn, high_score)
+                if last_id:
+                    self._write_tracking(conn, Tracking(leader_name, last_id))
+            if last_id > self.recorder.max_tracking_id(leader_name):
+                self._record(ProcessingEvent(Tracking(leader_name, last_id)))
+
+    @staticmethod
+    def _create_shadow_table(conn: sa.Connection) -> sa.Table:
+        """
+        Creates high_score_rebuild with the columns and primary key of high_score.
+        Constraint and index names are unique per schema on Postgres, so the primary
+        key gets a name of its own and the indexes are left to _restore_names.
+        Returns the reflected high_score.
+        """
+        high_score = sa.Table('high_score', sa.MetaData(), autoload_with=conn)
+        shadow = sa.Table('high_score_rebuild', sa.MetaData(), *(column._copy() for column in high_score.columns))
+        if high_score.primary_key.name:
+            shadow.primary_key.name = 'high_score_rebuild_pkey'
+        shadow.drop(conn, checkfirst=True)
+        shadow.create(conn)
+        return high_score
+
+    @staticmethod
+    def _restore_names(conn: sa.Connection, high_score: sa.Table) -> None:
+        """
+        Gives the swapped in table the primary key name and the indexes of the
+        replaced one, which are created after the bulk load.
+        """
+        if high_score.primary_key.name:
+            conn.execute(sa.text(
+                f"ALTER TABLE high_score RENAME CONSTRAINT high_score_rebuild_pkey TO {high_score.primary_key.name}"
+            ))
+        live = sa.Table('high_score', sa.MetaData(), autoload_with=conn)
+        for index in high_score.indexes:
+            sa.Index(
+                index.name, *(live.c[column.name] for column in index.columns), unique=index.unique
+            ).create(conn)
+
+    def _load_shadow_table(self, conn: sa.Connection, rows: list[dict]) -> None:
+        if conn.dialect.driver == 'psycopg':
+            with conn.connection.driver_connection.cursor() as cursor:
+                with cursor.copy("COPY high_score_rebuild (player_id, name, score) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row((row['player_id'], row['name'], row['score']))
+            return
+        statement = sa.text(
+            "INSERT INTO high_score_rebuild (player_id, name, score) VALUES (:player_id, :name, :score)"
+        )
+        for chunk_start in range(0, len(rows), self.REBUILD_CHUNK_SIZE):
+            conn.execute(statement, rows[chunk_start:chunk_start + self.REBUILD_CHUNK_SIZE])
 
     @singledispatchmethod
     def policy(self, domain_event: DomainEventProtocol, processing_event: ProcessingEvent) -> None:
@@ -100,18 +380,7 @@ class HallOfFameMaterialize(Follower):
         Re-create a state of an aggregate and write denormalized view
         Example bellow
         """
-        with self.engine.begin() as conn:
-            conn.execute(
-                sa.text(
-                    """
-                    INSERT INTO 
-                    high_score (name, player_id, score) 
-                    VALUES (:name, :player_id, 0)
-                    ON CONFLICT (player_id) DO UPDATE
-                    SET name = :name 
-                    """
-                ), {'name': domain_event.name, 'player_id': domain_event.player_id}
-            )
+        self._get_row(domain_event.player_id)['name'] = domain_event.name
         processing_event.collect_events(domain_event)
 
     @policy.register
@@ -120,15 +389,7 @@ class HallOfFameMaterialize(Follower):
         Re-create a state of an aggregate and write denormalized view
         Example bellow
         """
-        with self.engine.begin() as conn:
-            conn.execute(
-                sa.text(
-                    """
-                    INSERT INTO 
-                    high_score (score, name, player_id) 
-                    VALUES (:score, :name, :player_id)
-                    ON CONFLICT (player_id) DO UPDATE
-                    SET score = high_score.score + :score 
-                    """
-                ), {'score': domain_event.score, 'player_id': domain_event.player_id, 'name': None}
-            )
+        self._get_row(domain_event.player_id)['score'] += domain_event.score
+
+    def _get_row(self, player_id: UUID) -> dict:
+        return self._rows.setdefault(str(player_id), {'player_id': str(player_id), 'name': None, 'score': 0})
@@ -1,7 +1,11 @@
 from __future__ import annotations
+from functools import cache
 from typing import (
+    Any,
     Generic,
     Iterable,
+    TypeVar,
+    get_origin,
 )
 from uuid import UUID
 
@@ -150,8 +154,7 @@ class RootEntity(
 
     def create_event(self, __name: MessageName | str, /, **payload):
         increment_version(self)
-        event_class = get_event_class(self.__domain_name__, __name)
-        event = event_class(
+        event = _get_event_factory(self.__class__, __name)(
             originator_reference=self.__reference__,
             originator_version=self.__version__,
             **payload,
@@ -163,3 +166,52 @@ class RootEntity(
         events = self._events
         self._events = []
         yield from events
+
+
+class _EventFactory:
+    """
+    Creates events of one class. When every field is given a value of its declared
+    type, such as an already validated model, the event is built without validation.
+    """
+
+    def __init__(self, event_class: type[DomainEvent]):
+        self.event_class = event_class
+        self.field_types = {
+            name: _get_plain_type(field.annotation)
+            for name, field in event_class.model_fields.items()
+        }
+        self.private_attributes = event_class.__private_attributes__
+
+    def __call__(self, **values: Any) -> DomainEvent:
+        if values.keys() == self.field_types.keys() and all(
+            isinstance(value, self.field_types[name])
+            for name, value in values.items()
+        ):
+            return self._construct(values)
+        return self.event_class(**values)
+
+    def _construct(self, values: dict[str, Any]) -> DomainEvent:
+        # Same as model_construct without its defaults handling, which is slower than validation.
+        event = self.event_class.__new__(self.event_class)
+        object.__setattr__(event, '__dict__', {name: values[name] for name in self.field_types})
+        object.__setattr__(event, '__pydantic_fields_set__', set(values))
+        object.__setattr__(event, '__pydantic_extra__', None)
+        object.__setattr__(event, '__pydantic_private__', {
+            name: attribute.get_default() for name, attribute in self.private_attributes.items()
+        })
+        return event
+
+
+@cache
+def _get_event_factory(entity_class: type[RootEntity], name: str) -> _EventFactory:
+    return _EventFactory(get_event_class(entity_class.__domain_name__, name))
+
+
+def _get_plain_type(annotation: Any) -> type | tuple:
+    while hasattr(annotation, '__supertype__'):  # NewType
+        annotation = annotation.__supertype__
+    if isinstance(annotation, TypeVar):
+        annotation = annotation.__bound__
+    if isinstance(annotation, type) and get_origin(annotation) is None:
+        return annotation
+    return ()
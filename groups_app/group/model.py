@@ -1,5 +1,6 @@
 from __future__ import annotations
 from typing import (
+    Iterable,
     TypeVar,
 )
 from uuid import (
@@ -13,13 +14,20 @@ from pydantic import (
 from group.bases import (
     DomainEvent,
     RootEntity,
+    set_version,
 )
 
 ReferenceType = TypeVar("ReferenceType", bound=UUID)
 
 
 class GroupDomainEvent(DomainEvent, domain='group'):
-    ...
+    def apply(self, aggregate: Group) -> None:
+        builder = GroupStateBuilder.from_state(aggregate.state)
+        self.apply_state(builder)
+        aggregate.state = builder.build()
+
+    def apply_state(self, builder: GroupStateBuilder) -> None:
+        ...
 
 
 class GroupCreated(GroupDomainEvent):
@@ -38,12 +46,8 @@ class GroupCreated(GroupDomainEvent):
 class GroupRenamed(GroupDomainEvent):
     name: str
 
-    def apply(self, aggregate: RootEntity):
-        aggregate.state = GroupState(
-            name=self.name,
-            parent_id=aggregate.state.parent_id,
-            members=aggregate.state.members,
-        )
+    def apply_state(self, builder: GroupStateBuilder) -> None:
+        builder.name = self.name
 
 
 class GroupMember(BaseModel):
@@ -54,23 +58,15 @@ class GroupMember(BaseModel):
 class GroupMemberAdded(GroupDomainEvent):
     member: GroupMember
 
-    def apply(self, aggregate: Group) -> None:
-        aggregate.state = GroupState(
-            name=aggregate.state.name,
-            parent_id=aggregate.state.parent_id,
-            members=aggregate.state.members | {self.member.reference: self.member},
-        )
+    def apply_state(self, builder: GroupStateBuilder) -> None:
+        builder.add_member(self.member)
 
 
 class GroupReassigned(GroupDomainEvent):
     parent_id: ReferenceType
 
-    def apply(self, aggregate: Group) -> None:
-        aggregate.state = GroupState(
-            name=aggregate.state.name,
-            parent_id=self.parent_id,
-            members=aggregate.state.members,
-        )
+    def apply_state(self, builder: GroupStateBuilder) -> None:
+        builder.parent_id = self.parent_id
 
 
 class GroupState(BaseModel):
@@ -82,6 +78,43 @@ class GroupState(BaseModel):
         frozen = True
 
 
+class GroupStateBuilder:
+    """
+    Mutable working copy of a GroupState. The members map of the source state is
+    shared until the first member is added, and the GroupState is built without
+    validation, since every value comes from a validated event or state.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            parent_id: ReferenceType | None = None,
+            members: dict[ReferenceType, GroupMember] | None = None,
+    ):
+        self.name = name
+        self.parent_id = parent_id
+        self._members = members if members is not None else {}
+        self._shared = members is not None
+
+    @classmethod
+    def from_state(cls, state: GroupState) -> GroupStateBuilder:
+        return cls(name=state.name, parent_id=state.parent_id, members=state.members)
+
+    def add_member(self, member: GroupMember) -> None:
+        if self._shared:
+            self._members = dict(self._members)
+            self._shared = False
+        self._members[member.reference] = member
+
+    def build(self) -> GroupState:
+        self._shared = True
+        return GroupState.model_construct(
+            name=self.name,
+            parent_id=self.parent_id,
+            members=self._members,
+        )
+
+
 class Group(RootEntity, domain='group'):
     state: GroupState
 
@@ -97,6 +130,25 @@ class Group(RootEntity, domain='group'):
         group._events.append(event)
         return group
 
+    @classmethod
+    def replay(cls, events: Iterable[GroupDomainEvent], group: Group | None = None) -> Group | None:
+        """
+        Apply events to a builder in place and set the group state once at the end.
+        """
+        builder = GroupStateBuilder.from_state(group.state) if group is not None else None
+        for event in events:
+            if group is None:
+                group = event.mutate(None)
+                builder = GroupStateBuilder.from_state(group.state)
+                continue
+            assert group.__reference__ == event.originator_reference
+            assert event.originator_version == group.__version__ + 1
+            event.apply_state(builder)
+            set_version(group, event.originator_version)
+        if group is not None:
+            group.state = builder.build()
+        return group
+
     def rename(self, new_name: str):
         self.create_event(GroupRenamed.__name__, name=new_name)
 
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import json
+import os
+import typing as t
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import groupby
+from time import perf_counter
+from uuid import UUID
+
+import sqlalchemy as sa
+from d3m.domain import get_event_class
+from d3m.uow import (
+    IRepository,
+    IRepositoryBuilder,
+    IUnitOfWorkCtxMgr,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from group.bases import DomainEvent
+from group.model import (
+    Group,
+    GroupDomainEvent,
+    GroupState,
+)
+from group.usecase import (
+    IGroupReader,
+    IGroupRepository,
+)
+from seedwork.snapshots import (
+    ReplayMetrics,
+    SnapshotPolicy,
+)
+
+
+_group_events = sa.table(
+    'group_events',
+    sa.column('originator_reference'),
+    sa.column('originator_version'),
+    sa.column('event_reference'),
+    sa.column('timestamp'),
+    sa.column('domain'),
+    sa.column('name'),
+    sa.column('payload'),
+)
+
+_group_snapshots = sa.table(
+    'group_snapshots',
+    sa.column('originator_reference'),
+    sa.column('originator_version'),
+    sa.column('domain'),
+    sa.column('name'),
+    sa.column('state'),
+)
+
+
+class GroupNotFoundError(Exception):
+    pass
+
+
+class GroupReader(IGroupReader):
+    """
+    Loads a group with one query over one pooled connection: the latest snapshot
+    and the events after it come back as rows of the same result, ordered by version.
+
+    With cache_maxsize the latest loaded groups are kept in a cache shared by all
+    requests, and a cached group is caught up by reading only the events after it.
+
+    Every load is timed into replay_metrics and reported to the snapshot policy,
+    so that a group slow to load is snapshotted on its next commit.
+    """
+
+    _select_group = sa.text(
+        """
+        WITH snapshot AS (
+            SELECT originator_version, state FROM group_snapshots
+            WHERE originator_reference = :originator_reference
+            ORDER BY originator_version DESC
+            LIMIT 1
+        )
+        SELECT originator_version, state AS payload, NULL AS domain, NULL AS name,
+               NULL AS event_reference, NULL AS timestamp
+        FROM snapshot
+        UNION ALL
+        SELECT originator_version, payload, domain, name, event_reference, timestamp
+        FROM group_events
+        WHERE originator_reference = :originator_reference
+          AND originator_version > COALESCE((SELECT originator_version FROM snapshot), 0)
+        ORDER BY originator_version ASC
+        """
+    )
+
+    _select_groups = sa.text(
+        """
+        WITH snapshot AS (
+            SELECT originator_reference, originator_version, state FROM (
+                SELECT originator_reference, originator_version, state,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY originator_reference ORDER BY originator_version DESC
+                       ) AS position
+                FROM group_snapshots
+                WHERE originator_reference IN :references
+            ) AS ranked
+            WHERE position = 1
+        )
+        SELECT originator_reference, originator_version, state AS payload, NULL AS domain,
+               NULL AS name, NULL AS event_reference, NULL AS timestamp
+        FROM snapshot
+        UNION ALL
+        SELECT e.originator_reference, e.originator_version, e.payload, e.domain,
+               e.name, e.event_reference, e.timestamp
+        FROM group_events AS e
+        LEFT JOIN snapshot AS s ON s.originator_reference = e.originator_reference
+        WHERE e.originator_reference IN :references
+          AND e.originator_version > COALESCE(s.originator_version, 0)
+        ORDER BY originator_reference, originator_version ASC
+        """
+    ).bindparams(sa.bindparam('references', expanding=True))
+
+    _select_events = sa.text(
+        """
+        SELECT originator_version, payload, domain, name, event_reference, timestamp
+        FROM group_events
+        WHERE originator_reference = :originator_reference AND originator_version > :originator_version
+        ORDER BY originator_version ASC
+        """
+    )
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            cache_maxsize: int | None = None,
+            snapshot_policy: SnapshotPolicy | None = None,
+            replay_metrics: ReplayMetrics | None = None,
+    ):
+        self._engine = engine
+        self._cache_maxsize = cache_maxsize
+        self._cache: OrderedDict[UUID, Group] = OrderedDict()
+        self.snapshot_policy = snapshot_policy or SnapshotPolicy()
+        self.replay_metrics = replay_metrics or ReplayMetrics()
+
+    async def get(self, reference: UUID) -> Group:
+        cached = self._cache.get(reference)
+        if cached is None:
+            started = perf_counter()
+            rows = await self._fetch(self._select_group, {'originator_reference': reference})
+            if not rows:
+                raise GroupNotFoundError(reference)
+            group = self._load(reference, rows)
+            self._record_replay(reference, rows, perf_counter() - started)
+        else:
+            rows = await self._fetch(
+                self._select_events,
+                {'originator_reference': reference, 'originator_version': cached.__version__},
+            )
+            group = self._load(reference, rows, _copy(cached))
+        self._put(group)
+        return group
+
+    async def get_many(self, references: t.Iterable[UUID]) -> dict[UUID, Group]:
+        """
+        Loads the groups with one query, their rows are grouped by reference.
+        """
+        references = list(dict.fromkeys(references))
+        if not references:
+            return {}
+        started = perf_counter()
+        rows = await self._fetch(self._select_groups, {'references': references})
+        loaded: dict[UUID, Group] = {}
+        loaded_rows: dict[UUID, list[t.Mapping]] = {}
+        for reference, group_rows in groupby(rows, key=lambda row: row['originator_reference']):
+            reference = UUID(str(reference))
+            loaded_rows[reference] = list(group_rows)
+            loaded[reference] = self._load(reference, loaded_rows[reference])
+        # The groups share one query, so each is charged an even part of its time.
+        seconds = (perf_counter() - started) / max(len(loaded), 1)
+        for reference, group_rows in loaded_rows.items():
+            self._record_replay(reference, group_rows, seconds)
+        groups = {}
+        for reference in references:
+            if reference not in loaded:
+                raise GroupNotFoundError(reference)
+            groups[reference] = loaded[reference]
+            self._put(loaded[reference])
+        return groups
+
+    async def _fetch(self, statement: sa.TextClause, parameters: dict) -> t.Sequence[t.Mapping]:
+        async with self._engine.connect() as conn:
+            cursor = await conn.execute(statement, parameters)
+            return cursor.mappings().fetchall()
+
+    def _record_replay(self, reference: UUID, rows: t.Sequence[t.Mapping], seconds: float) -> None:
+        events = len(rows) - (1 if rows and rows[0]['name'] is None else 0)
+        self.replay_metrics.record(Group.__name__, seconds, events)
+        self.snapshot_policy.record_replay(reference, seconds)
+
+    def _put(self, group: Group) -> None:
+        if not self._cache_maxsize:
+            return
+        self._cache[group.__reference__] = _copy(group)
+        self._cache.move_to_end(group.__reference__)
+        while len(self._cache) > self._cache_maxsize:
+            self._cache.popitem(last=False)
+
+    def _load(self, reference: UUID, rows: t.Sequence[t.Mapping], group: Group | None = None) -> Group:
+        if rows and rows[0]['name'] is None:
+            group = Group(
+                __version__=rows[0]['originator_version'],
+                __reference__=reference,
+                state=GroupState.model_validate(_load_json(rows[0]['payload'])),
+            )
+            rows = rows[1:]
+        events = (
+            t.cast(
+                GroupDomainEvent, _get_event_class(row['domain'], row['name']).load(
+                    payload=dict(
+                        originator_version=row['originator_version'],
+                        originator_reference=reference,
+                        **_load_json(row['payload']),
+                    ),
+                    reference=row['event_reference'],
+                    timestamp=row['timestamp'],
+                )
+            )
+            for row in rows
+        )
+        return t.cast(Group, Group.replay(events, group))
+
+
+class GroupRepository(GroupReader, IGroupRepository):
+    """
+    Groups loaded or created in a unit of work are tracked by reference, so getting
+    a group twice returns the same object, and their new events are written on commit.
+    """
+    SNAPSHOTTING_INTERVAL = 100
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            snapshot_policy: SnapshotPolicy | None = None,
+            replay_metrics: ReplayMetrics | None = None,
+    ):
+        super().__init__(
+            engine,
+            snapshot_policy=snapshot_policy or SnapshotPolicy(interval=self.SNAPSHOTTING_INTERVAL),
+            replay_metrics=replay_metrics,
+        )
+        self._seen: dict[UUID, Group] = {}
+
+    def create(self, name: str, parent_id: UUID | None) -> Group:
+        group = Group.create(name, parent_id=parent_id)
+        self._seen[group.__reference__] = group
+        return group
+
+    async def get(self, reference: UUID) -> Group:
+        if reference not in self._seen:
+            self._seen[reference] = await super().get(reference)
+        return self._seen[reference]
+
+    async def get_many(self, references: t.Iterable[UUID]) -> dict[UUID, Group]:
+        references = list(dict.fromkeys(references))
+        loaded = await super().get_many(reference for reference in references if reference not in self._seen)
+        self._seen.update(loaded)
+        return {reference: self._seen[reference] for reference in references}
+
+    async def commit(self) -> None:
+        """
+        Writes the pending events and snapshots of all seen groups with one multi-row
+        insert per table. The unique (originator_reference, originator_version) keys
+        still reject concurrent writers, and the transaction is rolled back as a whole.
+        """
+        events: list[dict] = []
+        snapshots: list[dict] = []
+        snapshot_references: list[UUID] = []
+        while self._seen:
+            reference, aggregate = self._seen.popitem()
+            rows = [self._event_row(event) for event in aggregate.collect_events()]
+            if not rows:
+                continue
+            events.extend(rows)
+            self.snapshot_policy.record_size(reference, sum(len(row['payload']) for row in rows))
+            # The snapshot holds the current state, so take at most one per commit.
+            if self.snapshot_policy.is_due(reference, aggregate.__version__, events=len(rows)):
+                snapshots.append(self._snapshot_row(aggregate))
+                snapshot_references.append(reference)
+        if not events:
+            return
+        async with self._engine.begin() as conn:
+            await conn.execute(sa.insert(_group_events).values(events))
+            if snapshots:
+                await conn.execute(sa.insert(_group_snapshots).values(snapshots))
+        for reference in snapshot_references:
+            self.snapshot_policy.snapshot_taken(reference)
+
+    @staticmethod
+    def _snapshot_row(aggregate: Group) -> dict:
+        return dict(
+            originator_reference=aggregate.__reference__,
+            originator_version=aggregate.__version__,
+            domain=aggregate.__domain_name__,
+            name=aggregate.__class__.__name__,
+            state=aggregate.state.model_dump_json(),
+        )
+
+    @staticmethod
+    def _event_row(event: DomainEvent) -> dict:
+        return dict(
+            originator_reference=event.originator_reference,
+            originator_version=event.originator_version,
+            event_reference=event.__reference__,
+            timestamp=event.__timestamp__,
+            domain=event.__domain_name__,
+            name=event.__class__.__name__,
+            payload=event.model_dump_json(),
+        )
+
+
+class GroupRepositoryBuilder(IRepositoryBuilder[IGroupRepository]):
+    """
+    The repositories of all units of work share one snapshot policy, read from
+    GROUP_SNAPSHOT_INTERVAL, GROUP_SNAPSHOT_MAX_REPLAY_TIME and GROUP_SNAPSHOT_MAX_SIZE
+    unless given, and one replay_metrics.
+    """
+
+    def __init__(self, engine: AsyncEngine, snapshot_policy: SnapshotPolicy | None = None):
+        self._engine = engine
+        self.snapshot_policy = snapshot_policy or SnapshotPolicy.from_env(
+            os.environ, Group.__name__, interval=GroupRepository.SNAPSHOTTING_INTERVAL
+        )
+        self.replay_metrics = ReplayMetrics()
+
+    async def __call__(self, __uow_context_manager: IUnitOfWorkCtxMgr, /) -> IRepository:
+        return GroupRepository(self._engine, snapshot_policy=self.snapshot_policy, replay_metrics=self.replay_metrics)
+
+
+@lru_cache(maxsize=None)
+def _get_event_class(domain: str, name: str) -> type[DomainEvent]:
+    return get_event_class(domain, name)
+
+
+def _load_json(value: t.Any) -> dict:
+    # JSONB columns come back decoded, JSON stored as text (SQLite) does not.
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def _copy(group: Group) -> Group:
+    # The state is frozen, so the copy shares it.
+    return Group(__version__=group.__version__, __reference__=group.__reference__, state=group.state)
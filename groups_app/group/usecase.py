@@ -1,4 +1,6 @@
 import abc
+import asyncio
+from typing import Iterable
 from uuid import UUID
 
 from d3m.domain import DomainCommand
@@ -13,13 +15,24 @@ from group.model import Group
 collection = HandlersCollection()
 
 
-class IGroupRepository(IRepository, abc.ABC):
+class IGroupReader(abc.ABC):
     @abc.abstractmethod
-    def create(self, name: str, parent_id: UUID | None) -> Group:
+    async def get(self, reference: UUID) -> Group:
         ...
 
+    async def get_many(self, references: Iterable[UUID]) -> dict[UUID, Group]:
+        """
+        Loads groups by references. Repositories which can read many groups in one
+        query override it, by default the groups are loaded concurrently.
+        """
+        references = list(dict.fromkeys(references))
+        groups = await asyncio.gather(*(self.get(reference) for reference in references))
+        return dict(zip(references, groups))
+
+
+class IGroupRepository(IRepository, IGroupReader, abc.ABC):
     @abc.abstractmethod
-    async def get(self, reference: UUID) -> Group:
+    def create(self, name: str, parent_id: UUID | None) -> Group:
         ...
 
 
@@ -71,7 +84,51 @@ class ProduceGroupCommand(BaseCommand):
 async def produce_group(
         cmd: ProduceGroupCommand,
         uow_builder: UnitOfWorkBuilder[IGroupRepository],
+        group_reader: IGroupReader | None = None,
 ):
+    """
+    With a group reader set for the domain the group is read without a unit of work.
+    """
+    if group_reader is not None:
+        return await group_reader.get(cmd.reference)
     async with uow_builder() as uow:
         group = await uow.repository.get(cmd.reference)
     return group
+
+
+class ProduceGroupTreeCommand(BaseCommand):
+    reference: UUID
+
+
+@collection.register
+async def produce_group_tree(
+        cmd: ProduceGroupTreeCommand,
+        uow_builder: UnitOfWorkBuilder[IGroupRepository],
+        group_reader: IGroupReader | None = None,
+):
+    """
+    Loads the group and all groups under it breadth-first, one get_many per level.
+    Returns the groups by reference in breadth-first order.
+    """
+    if group_reader is not None:
+        return await _produce_tree(group_reader, cmd.reference)
+    async with uow_builder() as uow:
+        groups = await _produce_tree(uow.repository, cmd.reference)
+    return groups
+
+
+async def _produce_tree(reader: IGroupReader, reference: UUID) -> dict[UUID, Group]:
+    root = await reader.get(reference)
+    groups = {root.__reference__: root}
+    level = [root]
+    while level:
+        references = [
+            reference
+            for group in level
+            for reference in group.state.members
+            if reference not in groups
+        ]
+        children = await reader.get_many(references) if references else {}
+        groups.update(children)
+        level = list(children.values())
+    return groups
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Mapping,
+    TypeVar,
+)
+
+from eventsourcing.application import Application
+from eventsourcing.persistence import InfrastructureFactory
+
+TApplication = TypeVar('TApplication', bound=Application)
+T = TypeVar('T')
+
+
+class AsyncApplication(Generic[TApplication]):
+    """
+    Asyncio facade of a blocking application. Its methods run in a pool of
+    max_workers threads, by default ASYNC_WORKERS from the application env, or as
+    many threads as the Postgres pool has connections (POSTGRES_POOL_SIZE plus
+    POSTGRES_MAX_OVERFLOW), so calls wait in the pool rather than for a connection.
+
+    A cancelled call which has not started yet never runs. A call which already
+    runs completes in its thread, and its result is discarded.
+    """
+    ASYNC_WORKERS = 'ASYNC_WORKERS'
+
+    def __init__(self, app: TApplication, max_workers: int | None = None):
+        self.app = app
+        self.max_workers = max_workers or self._get_max_workers(app.env)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=type(app).__name__)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        future = self._executor.submit(partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Drops the call from the queue now, not on a later turn of the loop.
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        """
+        Waits for the running calls, then closes the application.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.app.close()
+
+    @classmethod
+    def _get_max_workers(cls, env: Mapping[str, str]) -> int:
+        max_workers = env.get(cls.ASYNC_WORKERS)
+        if max_workers:
+            return int(max_workers)
+        if 'postgres' in (env.get(InfrastructureFactory.PERSISTENCE_MODULE) or ''):
+            return int(env.get('POSTGRES_POOL_SIZE') or 5) + int(env.get('POSTGRES_MAX_OVERFLOW') or 10)
+        # The default of ThreadPoolExecutor.
+        return min(32, (os.cpu_count() or 1) + 4)
@@ -0,0 +1,73 @@
+from time import monotonic
+
+from eventsourcing.application import ProcessingEvent
+from eventsourcing.domain import DomainEventProtocol
+from eventsourcing.persistence import (
+    IntegrityError,
+    Tracking,
+)
+from eventsourcing.system import Follower
+
+
+class BatchingFollower(Follower):
+    """
+    Follower which processes the events of up to BATCH_SIZE notifications, or of
+    BATCH_INTERVAL seconds, as one batch. The policy buffers its changes, which
+    write_batch() writes once per batch, then the events collected in the batch
+    are recorded with the tracking of its last notification. A batch is also
+    flushed at the end of every pull of the notification log.
+
+    After a crash between write_batch() and the recording of the tracking, the
+    notifications of the batch are processed again. write_batch() must give the same
+    result when written again, or skip what it already wrote. The events collected in
+    processing_event are recorded with the tracking, so they are not recorded twice.
+    """
+    BATCH_SIZE = 'BATCH_SIZE'
+    BATCH_INTERVAL = 'BATCH_INTERVAL'
+
+    def __init__(self, env=None):
+        super().__init__(env)
+        self.batch_size = int(self.env.get(self.BATCH_SIZE, '1'))
+        self.batch_interval = float(self.env.get(self.BATCH_INTERVAL, '1'))
+        self._batch: ProcessingEvent | None = None
+        self._batch_length = 0
+        self._batch_started = 0.0
+
+    def pull_and_process(self, leader_name: str, start: int | None = None, stop: int | None = None) -> None:
+        super().pull_and_process(leader_name, start, stop)
+        self.flush()
+
+    def process_event(self, domain_event: DomainEventProtocol, tracking: Tracking) -> None:
+        with self.processing_lock:
+            if self._batch is None:
+                self._batch = ProcessingEvent()
+                self._batch_started = monotonic()
+            self._batch.tracking = tracking
+            self.policy(domain_event, self._batch)
+            self._batch_length += 1
+            if self._batch_length >= self.batch_size or monotonic() - self._batch_started >= self.batch_interval:
+                self.flush()
+
+    def flush(self) -> None:
+        with self.processing_lock:
+            processing_event = self._batch
+            if processing_event is None:
+                return
+            self._batch, self._batch_length = None, 0
+            self.write_batch(processing_event)
+            try:
+                recordings = self._record(processing_event)
+            except IntegrityError:
+                tracking = processing_event.tracking
+                if not self.recorder.has_tracking_id(tracking.application_name, tracking.notification_id):
+                    raise
+            else:
+                self._take_snapshots(processing_event)
+                self._notify(recordings)
+
+    def write_batch(self, processing_event: ProcessingEvent) -> None:
+        """
+        Writes the changes buffered by the policy, or collects their events
+        in processing_event. Called before the tracking is recorded, so the changes
+        may be written again after a crash.
+        """
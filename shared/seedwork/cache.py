@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
+from typing import (
+    Any,
+    List,
+)
+from uuid import UUID
+
+from eventsourcing.application import (
+    LRUCache,
+    ProcessingEvent,
+    Repository,
+)
+from eventsourcing.persistence import Recording
+from eventsourcing.utils import strtobool
+
+from seedwork.snapshots import (
+    MeasuredRepository,
+    SnapshottingApplication,
+)
+
+
+class AggregateCache(LRUCache[UUID, Any]):
+    """
+    LRU cache of aggregates with an optional time to live
+    and counters of hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stored_on: dict[UUID, float] = {}
+        self._stats_lock = Lock()
+
+    def get(self, key: UUID, *, evict: bool = False) -> Any:
+        try:
+            value = super().get(key, evict=evict)
+        except KeyError:
+            self._count(misses=1)
+            raise
+        if self.ttl is not None and monotonic() - self._stored_on.get(key, 0) > self.ttl:
+            if not evict:
+                super().get(key, evict=True)
+            self._stored_on.pop(key, None)
+            self._count(misses=1, evictions=1)
+            raise KeyError(key)
+        if evict:
+            self._stored_on.pop(key, None)
+        self._count(hits=1)
+        return value
+
+    def put(self, key: UUID, value: Any) -> Any | None:
+        self._stored_on[key] = monotonic()
+        evicted_key, evicted_value = super().put(key, value)
+        if evicted_value is not None:
+            self._stored_on.pop(evicted_key, None)
+            self._count(evictions=1)
+        return evicted_key, evicted_value
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _count(self, hits: int = 0, misses: int = 0, evictions: int = 0) -> None:
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+
+class CachedRepository(MeasuredRepository):
+    """
+    Puts the fast-forwarded aggregate back into the cache, so that projections
+    which return new objects (like pydantic models) don't replay the same events
+    on every cache hit.
+    """
+
+    def get(self, aggregate_id: UUID, *, version: int | None = None, **kwargs: Any) -> Any:
+        deepcopy_from_cache = kwargs.pop('deepcopy_from_cache', True)
+        aggregate = super().get(aggregate_id, version=version, deepcopy_from_cache=False, **kwargs)
+        if self.cache is None or version is not None:
+            return aggregate
+        self.cache.put(aggregate_id, aggregate)
+        if deepcopy_from_cache and self.deepcopy_from_cache:
+            aggregate = deepcopy(aggregate)
+        return aggregate
+
+
+class CachingApplication(SnapshottingApplication):
+    """
+    Application which keeps recently used aggregates in an :class:`AggregateCache`.
+
+    The cache is opt-in through AGGREGATE_CACHE_MAXSIZE and AGGREGATE_CACHE_TTL (seconds).
+    Copies of saved aggregates are put in the cache, or the aggregates themselves when
+    DEEPCOPY_FROM_AGGREGATE_CACHE is off. A cache hit is fast-forwarded by selecting the
+    events after the cached version, so entries written by other processes are caught.
+    """
+    AGGREGATE_CACHE_TTL = 'AGGREGATE_CACHE_TTL'
+
+    def construct_repository(self) -> Repository:
+        cache_maxsize = self.env.get(self.AGGREGATE_CACHE_MAXSIZE)
+        if not cache_maxsize:
+            return super().construct_repository()
+        cache_ttl = self.env.get(self.AGGREGATE_CACHE_TTL)
+        repository = CachedRepository(
+            event_store=self.events,
+            snapshot_store=self.snapshots,
+            fastforward_skipping=strtobool(
+                self.env.get(self.AGGREGATE_CACHE_FASTFORWARD_SKIPPING, "n")
+            ),
+            deepcopy_from_cache=strtobool(
+                self.env.get(self.DEEPCOPY_FROM_AGGREGATE_CACHE, "y")
+            ),
+        )
+        repository.cache = AggregateCache(
+            maxsize=int(cache_maxsize),
+            ttl=float(cache_ttl) if cache_ttl else None,
+        )
+        repository.on_replay = self._on_replay
+        return repository
+
+    def _record(self, processing_event: ProcessingEvent) -> List[Recording]:
+        recordings = super()._record(processing_event)
+        if self.repository.cache and self.repository.fastforward:
+            for aggregate_id, aggregate in processing_event.aggregates.items():
+                # The caller keeps the saved aggregate, and may change it without saving.
+                if self.repository.deepcopy_from_cache:
+                    aggregate = deepcopy(aggregate)
+                self.repository.cache.put(aggregate_id, aggregate)
+        return recordings
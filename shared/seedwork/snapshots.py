@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import logging
+import re
+from collections import OrderedDict
+from functools import partial
+from threading import (
+    Condition,
+    Lock,
+    Thread,
+)
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+)
+from uuid import UUID
+
+from eventsourcing.application import (
+    Application,
+    ProcessingEvent,
+    ProjectorFunction,
+    Repository,
+    project_aggregate,
+)
+from eventsourcing.domain import SnapshotProtocol
+from eventsourcing.persistence import Recording
+from eventsourcing.utils import strtobool
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotPolicy:
+    """
+    Decides when an aggregate is due for a snapshot: when its version crosses a
+    multiple of interval, when replaying it took longer than max_replay_time seconds,
+    or when the events stored since its last snapshot are over max_size bytes.
+    A trigger left as None is off.
+
+    Replay times and sizes are kept for the latest maxsize aggregates only.
+    """
+    SNAPSHOT_INTERVAL = 'SNAPSHOT_INTERVAL'
+    SNAPSHOT_MAX_REPLAY_TIME = 'SNAPSHOT_MAX_REPLAY_TIME'
+    SNAPSHOT_MAX_SIZE = 'SNAPSHOT_MAX_SIZE'
+
+    def __init__(
+            self,
+            interval: int | None = None,
+            max_replay_time: float | None = None,
+            max_size: int | None = None,
+            maxsize: int = 10000,
+    ):
+        self.interval = interval
+        self.max_replay_time = max_replay_time
+        self.max_size = max_size
+        self.maxsize = maxsize
+        self._slow: OrderedDict[UUID, float] = OrderedDict()
+        self._sizes: OrderedDict[UUID, int] = OrderedDict()
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str], name: str, interval: int | None = None) -> SnapshotPolicy:
+        """
+        Reads the triggers of the named aggregate class from env, e.g. for DogAggregate
+        DOG_AGGREGATE_SNAPSHOT_INTERVAL, DOG_AGGREGATE_SNAPSHOT_MAX_REPLAY_TIME (seconds)
+        and DOG_AGGREGATE_SNAPSHOT_MAX_SIZE (bytes). A zero value turns the trigger off.
+        """
+        prefix = re.sub(r'(?<!^)(?=[A-Z])', '_', name).upper()
+        interval_env = env.get(f'{prefix}_{cls.SNAPSHOT_INTERVAL}')
+        max_replay_time_env = env.get(f'{prefix}_{cls.SNAPSHOT_MAX_REPLAY_TIME}')
+        max_size_env = env.get(f'{prefix}_{cls.SNAPSHOT_MAX_SIZE}')
+        if interval_env:
+            interval = int(interval_env)
+        return cls(
+            interval=interval or None,
+            max_replay_time=float(max_replay_time_env or 0) or None,
+            max_size=int(max_size_env or 0) or None,
+        )
+
+    @property
+    def is_enabled(self) -> bool:
+        return any(trigger is not None for trigger in (self.interval, self.max_replay_time, self.max_size))
+
+    def is_due(self, aggregate_id: UUID, version: int, events: int = 1) -> bool:
+        """
+        Tells if the aggregate is due after its last events brought it to version.
+        """
+        if self.interval is not None and version // self.interval > (version - events) // self.interval:
+            return True
+        with self._lock:
+            if aggregate_id in self._slow:
+                return True
+            return self.max_size is not None and self._sizes.get(aggregate_id, 0) > self.max_size
+
+    def record_replay(self, aggregate_id: UUID, seconds: float) -> None:
+        if self.max_replay_time is None or seconds <= self.max_replay_time:
+            return
+        with self._lock:
+            self._remember(self._slow, aggregate_id, seconds)
+
+    def record_size(self, aggregate_id: UUID, size: int) -> None:
+        if self.max_size is None:
+            return
+        with self._lock:
+            self._remember(self._sizes, aggregate_id, self._sizes.get(aggregate_id, 0) + size)
+
+    def snapshot_taken(self, aggregate_id: UUID) -> None:
+        with self._lock:
+            self._slow.pop(aggregate_id, None)
+            self._sizes.pop(aggregate_id, None)
+
+    def _remember(self, values: OrderedDict[UUID, Any], aggregate_id: UUID, value: Any) -> None:
+        values[aggregate_id] = value
+        values.move_to_end(aggregate_id)
+        while len(values) > self.maxsize:
+            values.popitem(last=False)
+
+
+class ReplayMetrics:
+    """
+    Counts the replays of every aggregate class, how long they took and how many
+    events after the snapshot were replayed.
+    """
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = Lock()
+
+    def record(self, name: str, seconds: float, events: int) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                name, {'replays': 0, 'events': 0, 'seconds': 0.0, 'max_events': 0, 'max_seconds': 0.0}
+            )
+            stats['replays'] += 1
+            stats['events'] += events
+            stats['seconds'] += seconds
+            stats['max_events'] = max(stats['max_events'], events)
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+class SnapshotWorker:
+    """
+    Takes snapshots in a background thread, off the command path.
+
+    Requests are kept per aggregate, so a request for a later version replaces
+    the pending one. At most maxsize aggregates wait, requests beyond that are
+    dropped and counted: the policy asks again on a later save. Snapshots which
+    fail are logged and counted.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._pending: OrderedDict[UUID, tuple[int, Callable[[], None]]] = OrderedDict()
+        self._condition = Condition()
+        self._thread: Thread | None = None
+        self._busy = False
+        self._closed = False
+        self._stats = {'taken': 0, 'replaced': 0, 'dropped': 0, 'failed': 0}
+
+    def put(self, aggregate_id: UUID, version: int, take: Callable[[], None]) -> bool:
+        with self._condition:
+            if self._closed:
+                return False
+            if aggregate_id in self._pending:
+                if self._pending[aggregate_id][0] >= version:
+                    return True
+                self._stats['replaced'] += 1
+            elif len(self._pending) >= self.maxsize:
+                self._stats['dropped'] += 1
+                return False
+            self._pending[aggregate_id] = (version, take)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='snapshot-worker', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+            return True
+
+    def join(self) -> None:
+        """
+        Waits until the pending snapshots are taken.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._busy)
+
+    def close(self) -> None:
+        """
+        Takes the pending snapshots and stops the thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {'pending': len(self._pending), **self._stats}
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                aggregate_id, (version, take) = self._pending.popitem(last=False)
+                self._busy = True
+            try:
+                take()
+            except Exception:
+                logger.exception('Failed to take snapshot of %s at version %d', aggregate_id, version)
+                outcome = 'failed'
+            else:
+                outcome = 'taken'
+            with self._condition:
+                self._stats[outcome] += 1
+                self._busy = False
+                self._condition.notify_all()
+
+
+class MeasuredRepository(Repository):
+    """
+    Repository which reports every reconstruction of an aggregate from the store
+    to on_replay, with its duration (selecting included) and the number of events
+    replayed after the snapshot.
+    """
+    on_replay: Callable[[UUID, Any, float, int], None] | None = None
+
+    def _reconstruct_aggregate(self, aggregate_id: UUID, version: int | None, projector_func: Any) -> Any:
+        replayed = 0
+
+        def count(events: Iterable[Any]) -> Iterator[Any]:
+            nonlocal replayed
+            for position, event in enumerate(events):
+                if position or not isinstance(event, SnapshotProtocol):
+                    replayed += 1
+                yield event
+
+        started = perf_counter()
+        aggregate = super()._reconstruct_aggregate(
+            aggregate_id, version, lambda initial, events: projector_func(initial, count(events))
+        )
+        if self.on_replay is not None:
+            self.on_replay(aggregate_id, aggregate, perf_counter() - started, replayed)
+        return aggregate
+
+
+class SnapshottingApplication(Application):
+    """
+    Application which takes snapshots by a :class:`SnapshotPolicy` per aggregate class.
+
+    The policies start from snapshotting_intervals and are configured through env
+    (see :meth:`SnapshotPolicy.from_env`). Replays of the repository are counted
+    in replay_metrics.
+
+    With SNAPSHOTTING_IN_BACKGROUND the due snapshots are handed to a
+    :class:`SnapshotWorker` with a queue of SNAPSHOT_QUEUE_MAXSIZE aggregates.
+    """
+    SNAPSHOTTING_IN_BACKGROUND = 'SNAPSHOTTING_IN_BACKGROUND'
+    SNAPSHOT_QUEUE_MAXSIZE = 'SNAPSHOT_QUEUE_MAXSIZE'
+
+    is_snapshotting_in_background = False
+
+    def __init__(self, env: Mapping[str, str] | None = None):
+        self.replay_metrics = ReplayMetrics()
+        self._snapshot_policies: Dict[type, SnapshotPolicy] = {}
+        self._snapshot_policies_lock = Lock()
+        super().__init__(env)
+        self.snapshot_worker: SnapshotWorker | None = None
+        in_background = self.env.get(self.SNAPSHOTTING_IN_BACKGROUND)
+        if strtobool(in_background) if in_background else self.is_snapshotting_in_background:
+            self.snapshot_worker = SnapshotWorker(maxsize=int(self.env.get(self.SNAPSHOT_QUEUE_MAXSIZE, '1000')))
+
+    def snapshot_policy(self, aggregate_class: type) -> SnapshotPolicy:
+        try:
+            return self._snapshot_policies[aggregate_class]
+        except KeyError:
+            pass
+        with self._snapshot_policies_lock:
+            if aggregate_class not in self._snapshot_policies:
+                self._snapshot_policies[aggregate_class] = SnapshotPolicy.from_env(
+                    self.env,
+                    aggregate_class.__name__,
+                    interval=(self.snapshotting_intervals or {}).get(aggregate_class),
+                )
+            return self._snapshot_policies[aggregate_class]
+
+    def construct_repository(self) -> Repository:
+        cache_maxsize = self.env.get(self.AGGREGATE_CACHE_MAXSIZE)
+        repository = MeasuredRepository(
+            event_store=self.events,
+            snapshot_store=self.snapshots,
+            cache_maxsize=int(cache_maxsize) if cache_maxsize else None,
+            fastforward=strtobool(self.env.get(self.AGGREGATE_CACHE_FASTFORWARD, "y")),
+            fastforward_skipping=strtobool(
+                self.env.get(self.AGGREGATE_CACHE_FASTFORWARD_SKIPPING, "n")
+            ),
+            deepcopy_from_cache=strtobool(
+                self.env.get(self.DEEPCOPY_FROM_AGGREGATE_CACHE, "y")
+            ),
+        )
+        repository.on_replay = self._on_replay
+        return repository
+
+    def take_snapshots(
+            self,
+            aggregate_class: type,
+            recordings: List[Recording],
+            projector_func: ProjectorFunction[Any, Any] = project_aggregate,
+            get_state: Callable[[UUID], Any] | None = None,
+    ) -> None:
+        """
+        Takes the snapshots due after saving the recorded events of aggregate_class,
+        for applications which save events rather than aggregates.
+
+        When get_state returns the immutable state of an aggregate after the recorded
+        events, the snapshot is taken from it instead of reprojecting the aggregate.
+        It is called when the snapshot is taken, off the command path in the background,
+        so it must only read state which doesn't change meanwhile.
+        """
+        if self.snapshots is None:
+            return
+        policy = self.snapshot_policy(aggregate_class)
+        if not policy.is_enabled:
+            return
+        versions: Dict[UUID, List[int]] = {}
+        for recording in recordings:
+            policy.record_size(recording.notification.originator_id, len(recording.notification.state))
+            versions.setdefault(recording.domain_event.originator_id, []).append(
+                recording.domain_event.originator_version
+            )
+        self._take_due_snapshots(policy, versions, projector_func, get_state)
+
+    def close(self) -> None:
+        if self.snapshot_worker is not None:
+            self.snapshot_worker.close()
+        super().close()
+
+    def _record(self, processing_event: ProcessingEvent) -> List[Recording]:
+        recordings = super()._record(processing_event)
+        if self.snapshots is not None:
+            for recording in recordings:
+                aggregate = processing_event.aggregates.get(recording.domain_event.originator_id)
+                if aggregate is not None:
+                    self.snapshot_policy(type(aggregate)).record_size(
+                        recording.notification.originator_id, len(recording.notification.state)
+                    )
+        return recordings
+
+    def _take_snapshots(self, processing_event: ProcessingEvent) -> None:
+        if self.snapshots is None:
+            return
+        versions: Dict[type, Dict[UUID, List[int]]] = {}
+        for event in processing_event.events:
+            aggregate = processing_event.aggregates.get(event.originator_id)
+            if aggregate is not None:
+                versions.setdefault(type(aggregate), {}).setdefault(event.originator_id, []).append(
+                    event.originator_version
+                )
+        for aggregate_class, aggregate_versions in versions.items():
+            policy = self.snapshot_policy(aggregate_class)
+            if policy.is_enabled:
+                projector_func = (self.snapshotting_projectors or {}).get(aggregate_class, project_aggregate)
+                self._take_due_snapshots(policy, aggregate_versions, projector_func)
+
+    def _take_due_snapshots(
+            self,
+            policy: SnapshotPolicy,
+            versions: Dict[UUID, List[int]],
+            projector_func: ProjectorFunction[Any, Any],
+            get_state: Callable[[UUID], Any] | None = None,
+    ) -> None:
+        # One snapshot of the last version, however many events were saved.
+        for aggregate_id, aggregate_versions in versions.items():
+            version = max(aggregate_versions)
+            if not policy.is_due(aggregate_id, version, events=len(aggregate_versions)):
+                continue
+            take = partial(self._take_snapshot, policy, aggregate_id, version, projector_func, get_state)
+            if self.snapshot_worker is None:
+                take()
+            else:
+                self.snapshot_worker.put(aggregate_id, version, take)
+
+    def _take_snapshot(
+            self,
+            policy: SnapshotPolicy,
+            aggregate_id: UUID,
+            version: int,
+            projector_func: ProjectorFunction[Any, Any],
+            get_state: Callable[[UUID], Any] | None,
+    ) -> None:
+        state = get_state(aggregate_id) if get_state is not None else None
+        if state is None:
+            self.take_snapshot(aggregate_id, version, projector_func=projector_func)
+        else:
+            self._put_snapshot(state)
+        policy.snapshot_taken(aggregate_id)
+
+    def _put_snapshot(self, state: Any) -> None:
+        snapshot_class = getattr(type(state), 'Snapshot', type(self).snapshot_class)
+        self.snapshots.put([snapshot_class.take(state)])
+
+    def _on_replay(self, aggregate_id: UUID, aggregate: Any, seconds: float, events: int) -> None:
+        self.replay_metrics.record(type(aggregate).__name__, seconds, events)
+        self.snapshot_policy(type(aggregate)).record_replay(aggregate_id, seconds)
@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import uuid
 
-from school.application import DogSchool
+import pytest
+from eventsourcing.persistence import IntegrityError
+
+from school.application import (
+    AsyncDogSchool,
+    DogSchool,
+    DogsNotRegisteredError,
+    TricksNotAddedError,
+)
+from school.domainmodel import DogAggregate
 
 
 def test_dog_school() -> None:
@@ -21,3 +31,150 @@ def test_add_trick():
     fido = app.get_dog("Fido")
     assert fido['tricks'] == tricks
 
+
+def test_add_trick_with_cache():
+    app = DogSchool(env={'AGGREGATE_CACHE_MAXSIZE': '10'})
+    app.register_dog('Fido')
+    tricks = [str(uuid.uuid4()) for _ in range(20)]
+    for t in tricks:
+        app.add_trick("Fido", t)
+    assert app.get_dog("Fido")['tricks'] == tricks
+    assert app.repository.cache.stats() == {'hits': 21, 'misses': 1, 'evictions': 0}
+
+def test_cache_fastforward_from_other_process(tmp_path):
+    env = {
+        'AGGREGATE_CACHE_MAXSIZE': '10',
+        'PERSISTENCE_MODULE': 'eventsourcing.sqlite',
+        'SQLITE_DBNAME': str(tmp_path / 'dogs.db'),
+    }
+    app = DogSchool(env=env)
+    other = DogSchool(env=env)
+    app.register_dog('Fido')
+    app.add_trick('Fido', 'roll over')
+    other.add_trick('Fido', 'fetch ball')
+    app.add_trick('Fido', 'play dead')
+    assert other.get_dog('Fido')['tricks'] == ['roll over', 'fetch ball', 'play dead']
+
+
+def test_register_dogs():
+    app = DogSchool()
+    fido_id = app.register_dog('Fido')
+    ids = app.register_dogs(['Fido', 'Rex', 'Rex'])
+    assert ids == [fido_id, app.register_dog('Rex'), app.register_dog('Rex')]
+    assert app.get_dog('Rex') == {'name': 'Rex', 'tricks': []}
+    assert len(list(app.events.get(ids[1]))) == 1
+
+
+def test_register_dogs_registered_concurrently(monkeypatch):
+    app = DogSchool()
+    rex_id = app.register_dog('Rex')
+    is_registered = app._is_registered
+    checked = set()
+
+    def missed_once(dog_id):
+        # As if Rex was registered by another process after it was checked.
+        if dog_id == rex_id and dog_id not in checked:
+            checked.add(dog_id)
+            return False
+        return is_registered(dog_id)
+
+    monkeypatch.setattr(app, '_is_registered', missed_once)
+    ids = app.register_dogs(['Fido', 'Rex'])
+    assert ids == [DogAggregate.create_id('Fido'), rex_id]
+    assert app.get_dog('Fido') == {'name': 'Fido', 'tricks': []}
+    assert len(list(app.events.get(rex_id))) == 1
+
+
+def test_register_dogs_failures(monkeypatch):
+    app = DogSchool()
+    app.register_dog('Rex')
+    monkeypatch.setattr(app, '_is_registered', lambda dog_id: False)
+    with pytest.raises(DogsNotRegisteredError) as error:
+        app.register_dogs(['Fido', 'Rex'])
+    assert list(error.value.failures) == [1]
+    assert isinstance(error.value.failures[1], IntegrityError)
+    assert app.get_dog('Fido') == {'name': 'Fido', 'tricks': []}
+
+
+def test_add_tricks():
+    app = DogSchool()
+    app.register_dogs(['Fido', 'Rex'])
+    tricks = [('Fido', 'roll over'), ('Bob', 'fetch ball'), ('Rex', 'play dead')]
+    tricks += [('Fido', str(i)) for i in range(20)]
+    with pytest.raises(TricksNotAddedError) as error:
+        app.add_tricks(tricks)
+    assert sorted(error.value.failures) == [1, 22]
+    assert isinstance(error.value.failures[22], ValueError)
+    assert app.get_dog('Fido')['tricks'] == ['roll over'] + [str(i) for i in range(19)]
+    assert app.get_dog('Rex')['tricks'] == ['play dead']
+
+
+def test_add_tricks_changed_concurrently(tmp_path):
+    env = {'PERSISTENCE_MODULE': 'eventsourcing.sqlite', 'SQLITE_DBNAME': str(tmp_path / 'dogs.db')}
+    app = DogSchool(env=env)
+    other = DogSchool(env=env)
+    app.register_dogs(['Fido', 'Rex', 'Bob'])
+    other.add_tricks([('Bob', str(i)) for i in range(19)])
+    get = app.repository.get
+    changed = set()
+
+    def get_then_change(dog_id, *args, **kwargs):
+        dog = get(dog_id, *args, **kwargs)
+        # As if another process added a trick after the dog was loaded.
+        if dog.name != 'Fido' and dog.name not in changed:
+            changed.add(dog.name)
+            other.add_trick(dog.name, 'sit')
+        return dog
+
+    app.repository.get = get_then_change
+    with pytest.raises(TricksNotAddedError) as error:
+        app.add_tricks([('Fido', 'roll over'), ('Rex', 'play dead'), ('Bob', 'fetch ball')])
+    app.repository.get = get
+    assert list(error.value.failures) == [2]
+    assert isinstance(error.value.failures[2], ValueError)
+    assert app.get_dog('Fido')['tricks'] == ['roll over']
+    assert app.get_dog('Rex')['tricks'] == ['sit', 'play dead']
+    assert len(app.get_dog('Bob')['tricks']) == 20
+
+
+@pytest.mark.parametrize('batch', (False, True))
+def test_load_add_tricks(batch):
+    app = DogSchool()
+    names = [f'dog-{i}' for i in range(200)]
+    tricks = [(name, str(i)) for i in range(20) for name in names]
+    if batch:
+        app.register_dogs(names)
+        app.add_tricks(tricks)
+    else:
+        for name in names:
+            app.register_dog(name)
+        for name, trick in tricks:
+            app.add_trick(name, trick)
+    assert len(app.get_dog('dog-0')['tricks']) == 20
+
+
+def test_snapshot_interval_from_env():
+    app = DogSchool(env={'DOG_AGGREGATE_SNAPSHOT_INTERVAL': '5'})
+    dog_id = app.register_dog('Fido')
+    app.add_tricks([('Fido', str(i)) for i in range(11)])
+    assert [snapshot.originator_version for snapshot in app.snapshots.get(dog_id)] == [12]
+    for i in range(3):
+        app.add_trick('Fido', str(i))
+    assert [snapshot.originator_version for snapshot in app.snapshots.get(dog_id)] == [12, 15]
+    assert app.get_dog('Fido')['tricks'][-3:] == ['0', '1', '2']
+    # The longest replay is the one taking the first snapshot.
+    assert app.replay_metrics.stats()['DogAggregate']['max_events'] == 12
+
+
+def test_async_dog_school():
+    app = AsyncDogSchool(DogSchool(), max_workers=2)
+
+    async def main():
+        await app.register_dogs(['Fido', 'Rex'])
+        await asyncio.gather(app.add_trick('Fido', 'roll over'), app.add_trick('Rex', 'play dead'))
+        return await app.get_dog('Fido'), await app.get_dog('Rex')
+
+    fido, rex = asyncio.run(main())
+    app.close()
+    assert fido['tricks'] == ['roll over']
+    assert rex['tricks'] == ['play dead']
@@ -1,7 +1,10 @@
+from threading import Lock
 from time import sleep
 from uuid import uuid4
 
 import pytest
+from eventsourcing.cipher import AESCipher
+from eventsourcing.persistence import IntegrityError
 from eventsourcing.system import (
     MultiThreadedRunner,
     System,
@@ -12,6 +15,7 @@ from school.application import DogSchool
 from school.domainmodel import DogAggregate
 from school.service import DogService
 from school.system import (
+    Counter,
     Counters,
     Printers,
 )
@@ -64,6 +68,18 @@ def single_thread_runner(system):
     yield runner
     runner.stop()
 
+@pytest.fixture
+def counters_system():
+    return System(pipes=[[DogSchool, Counters]])
+
+
+@pytest.fixture
+def batch_single_thread_runner(counters_system):
+    runner = SingleThreadedRunner(counters_system, env={'BATCH_SIZE': '100'})
+    runner.start()
+    yield runner
+    runner.stop()
+
 def test_get_app_before_start():
     system = System(pipes=[[DogSchool]])
     runner = SingleThreadedRunner(system=system)
@@ -215,3 +231,108 @@ def test_persistence_multithread_runner(multithread_persistence_runner):
 
     billy = school.get_dog(billy)
     assert billy
+
+def test_counters_batch(batch_single_thread_runner):
+    school = batch_single_thread_runner.get(DogSchool)
+    counters = batch_single_thread_runner.get(Counters)
+    names = [f'dog-{i}' for i in range(150)]
+    school.register_dogs(names)
+    school.add_tricks([(name, 'roll over') for name in names])
+    assert counters.get_count('roll over') == 150
+    assert counters.get_count('dog-0') == 1
+
+    school.add_trick('dog-0', 'roll over')
+    assert counters.get_count('roll over') == 151
+
+    events = list(counters.events.get(Counter.create_id('roll over')))
+    assert [type(e).__name__ for e in events] == [
+        'Created', 'IncrementedBy', 'IncrementedBy', 'Incremented',
+    ]
+    assert [getattr(e, 'n', 1) for e in events[1:]] == [100, 50, 1]
+
+
+@pytest.mark.parametrize('batch_size', ('1', '1000'))
+def test_counters_load(counters_system, batch_size):
+    runner = SingleThreadedRunner(counters_system, env={'BATCH_SIZE': batch_size})
+    runner.start()
+    try:
+        school = runner.get(DogSchool)
+        counters = runner.get(Counters)
+        names = [f'dog-{i}' for i in range(100)]
+        school.register_dogs(names)
+        school.add_tricks([(name, f'trick-{i}') for i in range(10) for name in names])
+        assert counters.get_count('trick-0') == 100
+    finally:
+        runner.stop()
+
+
+def test_counters_catch_up():
+    school = DogSchool()
+    counters = Counters(env={'CATCH_UP_WORKERS': '2', 'CATCH_UP_PAGE_SIZE': '100'})
+    counters.follow(school.name, school.notification_log)
+    names = [f'dog-{i}' for i in range(150)]
+    school.register_dogs(names)
+    school.add_tricks([(name, 'roll over') for name in names])
+    counters.catch_up(school.name)
+    assert counters.recorder.max_tracking_id(school.name) == 300
+    assert counters.get_count('roll over') == 150
+    assert counters.get_count('dog-0') == 1
+
+    school.add_trick('dog-0', 'play dead')
+    counters.catch_up(school.name)
+    counters.pull_and_process(school.name)
+    assert counters.get_count('roll over') == 150
+    assert counters.get_count('play dead') == 1
+
+
+def test_counters_catch_up_cipher():
+    env = {'CIPHER_KEY': AESCipher.create_key(16), 'COMPRESSOR_TOPIC': 'zlib'}
+    school = DogSchool(env=env)
+    # Only the mapper settings go to the workers, an extra dependency in env may not pickle.
+    counters = Counters(env={**env, 'CATCH_UP_WORKERS': '2', 'extra_dep': Lock()})
+    counters.follow(school.name, school.notification_log)
+    school.register_dogs(['Fido', 'Buster'])
+    school.add_tricks([('Fido', 'roll over'), ('Buster', 'roll over')])
+    counters.catch_up(school.name)
+    assert counters.get_count('roll over') == 2
+    assert counters.get_count('Fido') == 1
+
+
+def test_counters_catch_up_processed_concurrently(tmp_path):
+    school = DogSchool()
+    env = {
+        'PERSISTENCE_MODULE': 'eventsourcing.sqlite',
+        'SQLITE_DBNAME': str(tmp_path / 'counters.db'),
+        'CATCH_UP_WORKERS': '1',
+    }
+    counters, other = Counters(env=env), Counters(env=env)
+    counters.follow(school.name, school.notification_log)
+    other.follow(school.name, school.notification_log)
+    school.register_dogs(['Fido', 'Rex'])
+    filter_received_notifications = counters.filter_received_notifications
+
+    def process_elsewhere(notifications):
+        # As if another process followed the same leader during the catch-up.
+        other.pull_and_process(school.name)
+        return filter_received_notifications(notifications)
+
+    counters.filter_received_notifications = process_elsewhere
+    with pytest.raises(IntegrityError):
+        counters.catch_up(school.name)
+    assert counters.get_count('Fido') == 1
+
+
+@pytest.mark.parametrize('workers', ('', '1', '2'))
+def test_counters_catch_up_load(workers):
+    school = DogSchool()
+    names = [f'dog-{i}' for i in range(500)]
+    school.register_dogs(names)
+    for i in range(9):
+        school.add_tricks([(name, f'trick-{i % 5}') for name in names])
+    counters = Counters(env={'BATCH_SIZE': '100000', 'CATCH_UP_WORKERS': workers})
+    counters.follow(school.name, school.notification_log)
+    if workers:
+        counters.catch_up(school.name)
+    else:
+        counters.pull_and_process(school.name)
+    assert counters.get_count('trick-0') == 1000
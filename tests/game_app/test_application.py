@@ -1,6 +1,11 @@
+import asyncio
+
 import pytest
 
-from game.application import Game
+from game.application import (
+    AsyncGame,
+    Game,
+)
 
 
 @pytest.fixture
@@ -18,3 +23,24 @@ def test_add_score(app):
     app.add_score(john_id, 20)
     john = app.get(john_id)
     assert john.score == 30
+
+@pytest.mark.parametrize('cache_maxsize', ('', '100'))
+def test_load_hot_player(cache_maxsize):
+    app = Game(env={'AGGREGATE_CACHE_MAXSIZE': cache_maxsize})
+    john_id = app.register("John")
+    for _ in range(1000):
+        app.add_score(john_id, 1)
+    assert app.get(john_id).score == 1000
+
+def test_async_add_score():
+    app = AsyncGame(Game(), max_workers=2)
+
+    async def main():
+        john_id = await app.register("John")
+        for score in (10, 20):
+            await app.add_score(john_id, score)
+        return await app.get(john_id)
+
+    john = asyncio.run(main())
+    app.close()
+    assert john.score == 30
@@ -1,15 +1,22 @@
+from time import sleep
+from uuid import uuid4
+
 import pytest
 from eventsourcing.system import (
     System,
     SingleThreadedRunner,
     MultiThreadedRunner,
 )
+import sqlalchemy as sa
 from sqlalchemy import create_engine
 
 from game.application import Game
+from game.domainmodel import Player
 from game.system import (
     HallOfFame,
     HallOfFameMaterialize,
+    HighScoreTable,
+    HighScoreTableShard,
 )
 
 
@@ -78,4 +85,251 @@ def test_system(multi_thread_persistence_runner):
     assert score_table.get_top() == [('Alice', 20), ('Kate', 15), ('John', 10)]
 
     game.add_score(lui, 30)
-    assert score_table.get_top() == [('Lui', 35), ('Alice', 20), ('Kate', 15)]
\ No newline at end of file
+    assert score_table.get_top() == [('Lui', 35), ('Alice', 20), ('Kate', 15)]
+
+@pytest.fixture
+def sharded_system():
+    return System(pipes=[[Game, HallOfFame]])
+
+
+@pytest.fixture
+def sharded_single_threaded_runner(sharded_system):
+    runner = SingleThreadedRunner(sharded_system, env={'HIGH_SCORE_SHARDS': '4'})
+    runner.start()
+    yield runner
+    runner.stop()
+
+
+def test_sharded_system(sharded_single_threaded_runner):
+    game = sharded_single_threaded_runner.get(Game)
+    john = game.register("John")
+    alice = game.register("Alice")
+    kate = game.register("Kate")
+    lui = game.register("Lui")
+
+    game.add_score(alice, 20)
+    game.add_score(kate, 15)
+    game.add_score(john, 10)
+    game.add_score(lui, 5)
+
+    score_table = sharded_single_threaded_runner.get(HallOfFame)
+    assert score_table.get_top(3) == [('Alice', 20), ('Kate', 15), ('John', 10)]
+
+    game.add_score(lui, 30)
+    assert score_table.get_top(3) == [('Lui', 35), ('Alice', 20), ('Kate', 15)]
+    assert len(score_table.get_top()) == 4
+
+    replays = score_table.replay_metrics.stats()['HighScoreTableShard']['replays']
+    assert score_table.get_rank(lui) == 1
+    assert score_table.get_rank(john) == 4
+    # Every shard is loaded once by a rank query, the one of the player included.
+    shards = len({HighScoreTableShard.get_shard(player_id, 4) for player_id in (john, alice, kate, lui)})
+    assert score_table.replay_metrics.stats()['HighScoreTableShard']['replays'] == replays + 2 * shards
+
+
+def test_shard_ids():
+    player_id = Player.create_id('John')
+    shard = HighScoreTableShard.get_shard(player_id, 8)
+    assert 0 <= shard < 8
+    assert HighScoreTableShard.get_shard(player_id, 8) == shard
+    assert HighScoreTableShard.create_id(shard) != HighScoreTable.create_id()
+
+
+@pytest.mark.parametrize('shards, changed', (('1', '4'), ('4', '1'), ('4', '8')))
+def test_shards_changed(tmp_path, shards, changed):
+    env = {'PERSISTENCE_MODULE': 'eventsourcing.sqlite', 'SQLITE_DBNAME': str(tmp_path / 'hall_of_fame.db')}
+    game = Game()
+    hall_of_fame = HallOfFame(env={**env, 'HIGH_SCORE_SHARDS': shards})
+    hall_of_fame.follow(Game.name, game.notification_log)
+    for name in ('John', 'Alice', 'Kate', 'Lui'):
+        game.register(name)
+    hall_of_fame.pull_and_process(Game.name)
+
+    assert HallOfFame(env={**env, 'HIGH_SCORE_SHARDS': shards}).get_rank(Player.create_id('John'))
+    with pytest.raises(OSError, match=f'stored with {shards} shards'):
+        HallOfFame(env={**env, 'HIGH_SCORE_SHARDS': changed})
+
+
+@pytest.mark.parametrize('shards', ('1', '4', '16'))
+def test_load_sharded(sharded_system, shards):
+    runner = MultiThreadedRunner(sharded_system, env={'HIGH_SCORE_SHARDS': shards})
+    runner.start()
+    try:
+        game = runner.get(Game)
+        hall_of_fame = runner.get(HallOfFame)
+        players = [game.register(str(uuid4())) for _ in range(200)]
+        for player_id in players:
+            game.add_score(player_id, 1)
+        for _ in range(100):
+            if hall_of_fame.recorder.max_tracking_id(Game.name) == 400:
+                break
+            sleep(0.1)
+        assert len(hall_of_fame.get_top()) == 200
+    finally:
+        runner.stop()
+
+
+def test_high_score_table_ranking():
+    table = HighScoreTable()
+    players = [Player.create_id(name) for name in ('John', 'Alice', 'Kate')]
+    for name, player_id in zip(('John', 'Alice', 'Kate'), players):
+        table.register(player_id, name)
+    table.increment_score(players[0], 10)
+    table.increment_score(players[1], 20)
+    table.increment_score(players[2], 15)
+    table.increment_score(players[0], 30)
+
+    assert table.get_top() == [('John', 40), ('Alice', 20), ('Kate', 15)]
+    assert table.get_top(2) == [('John', 40), ('Alice', 20)]
+    assert table.get_rank(players[2]) == 3
+    assert table.get_rank(Player.create_id('Lui')) is None
+
+
+def test_high_score_table_from_snapshot():
+    game = Game()
+    hall_of_fame = HallOfFame()
+    players = [game.register(str(i)) for i in range(150)]
+    for i, player_id in enumerate(players):
+        game.add_score(player_id, i)
+    hall_of_fame.follow(Game.name, game.notification_log)
+    hall_of_fame.pull_and_process(Game.name)
+
+    assert list(hall_of_fame.snapshots.get(HighScoreTable.create_id(), desc=True, limit=1))
+    assert hall_of_fame.get_top(3) == [('149', 149), ('148', 148), ('147', 147)]
+    assert hall_of_fame.get_rank(players[0]) == 150
+    assert hall_of_fame.get_rank(players[140]) == 10
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'high_score.db'}")
+    with engine.begin() as conn:
+        conn.execute(sa.text(
+            "CREATE TABLE high_score (player_id TEXT PRIMARY KEY, name TEXT, score INTEGER NOT NULL DEFAULT 0)"
+        ))
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize('batch_size', ('1', '50'))
+def test_materialize_batches(system, sqlite_engine, batch_size):
+    runner = SingleThreadedRunner(system, env={'postgresql_engine': sqlite_engine, 'BATCH_SIZE': batch_size})
+    runner.start()
+    try:
+        game = runner.get(Game)
+        john = game.register("John")
+        alice = game.register("Alice")
+        game.add_score(alice, 20)
+        game.add_score(john, 10)
+        game.add_score(john, 5)
+        materialize = runner.get(HallOfFameMaterialize)
+        assert materialize.recorder.max_tracking_id(HallOfFame.name) == 6
+        with sqlite_engine.begin() as conn:
+            rows = conn.execute(sa.text("SELECT name, score FROM high_score ORDER BY score DESC")).fetchall()
+        assert rows == [('Alice', 20), ('John', 15)]
+    finally:
+        runner.stop()
+
+
+@pytest.mark.parametrize('batch_size', ('1', '100'))
+def test_load_materialize(sharded_single_threaded_runner, sqlite_engine, batch_size):
+    game = sharded_single_threaded_runner.get(Game)
+    players = [game.register(str(uuid4())) for _ in range(20)]
+    for _ in range(50):
+        for player_id in players:
+            game.add_score(player_id, 1)
+
+    materialize = HallOfFameMaterialize(env={'postgresql_engine': sqlite_engine, 'BATCH_SIZE': batch_size})
+    hall_of_fame = sharded_single_threaded_runner.get(HallOfFame)
+    materialize.follow(HallOfFame.name, hall_of_fame.notification_log)
+    materialize.pull_and_process(HallOfFame.name)
+
+    assert materialize.recorder.max_tracking_id(HallOfFame.name) == 1024
+    with sqlite_engine.begin() as conn:
+        total = conn.execute(sa.text("SELECT SUM(score) FROM high_score")).scalar()
+    assert total == 1000
+
+
+def test_materialize_tracking_lost(sqlite_engine):
+    game = Game()
+    hall_of_fame = HallOfFame()
+    hall_of_fame.follow(Game.name, game.notification_log)
+    john, alice = game.register('John'), game.register('Alice')
+    game.add_score(john, 10)
+    game.add_score(alice, 20)
+    hall_of_fame.pull_and_process(Game.name)
+    env = {'postgresql_engine': sqlite_engine, 'BATCH_SIZE': '100'}
+    materialize = HallOfFameMaterialize(env=env)
+    materialize.follow(HallOfFame.name, hall_of_fame.notification_log)
+    materialize.pull_and_process(HallOfFame.name)
+
+    # As if the rows were written and the process crashed before the tracking was recorded.
+    materialize = HallOfFameMaterialize(env=env)
+    materialize.follow(HallOfFame.name, hall_of_fame.notification_log)
+    game.add_score(john, 5)
+    hall_of_fame.pull_and_process(Game.name)
+    materialize.pull_and_process(HallOfFame.name)
+    with sqlite_engine.begin() as conn:
+        rows = conn.execute(sa.text("SELECT name, score FROM high_score ORDER BY score DESC")).fetchall()
+    assert rows == [('Alice', 20), ('John', 15)]
+    assert materialize.recorder.max_tracking_id(HallOfFame.name) == 6
+
+
+def test_materialize_rebuild(system, sqlite_engine):
+    runner = SingleThreadedRunner(system, env={'postgresql_engine': sqlite_engine})
+    runner.start()
+    try:
+        game = runner.get(Game)
+        materialize = runner.get(HallOfFameMaterialize)
+        john, alice = game.register('John'), game.register('Alice')
+        game.add_score(john, 10)
+        game.add_score(alice, 20)
+        with sqlite_engine.begin() as conn:
+            conn.execute(sa.text("UPDATE high_score SET score = 0"))
+
+        materialize.rebuild(HallOfFame.name)
+        game.add_score(john, 5)
+        with sqlite_engine.begin() as conn:
+            rows = conn.execute(sa.text("SELECT name, score FROM high_score ORDER BY score DESC")).fetchall()
+            tables = conn.execute(sa.text("SELECT name FROM sqlite_master WHERE type = 'table'")).fetchall()
+        assert rows == [('Alice', 20), ('John', 15)]
+        assert sorted(tables) == [('high_score',), ('high_score_tracking',)]
+    finally:
+        runner.stop()
+
+
+@pytest.mark.parametrize('rebuild', (False, True))
+def test_load_materialize_rebuild(sharded_single_threaded_runner, sqlite_engine, rebuild):
+    game = sharded_single_threaded_runner.get(Game)
+    players = [game.register(str(uuid4())) for _ in range(100)]
+    for _ in range(10):
+        for player_id in players:
+            game.add_score(player_id, 1)
+    materialize = HallOfFameMaterialize(env={'postgresql_engine': sqlite_engine})
+    hall_of_fame = sharded_single_threaded_runner.get(HallOfFame)
+    materialize.follow(HallOfFame.name, hall_of_fame.notification_log)
+    if rebuild:
+        materialize.rebuild(HallOfFame.name)
+    else:
+        materialize.pull_and_process(HallOfFame.name)
+    with sqlite_engine.begin() as conn:
+        total = conn.execute(sa.text("SELECT SUM(score) FROM high_score")).scalar()
+    assert total == 1000
+
+
+def test_materialize_rebuild_postgres(single_threaded_runner):
+    game = single_threaded_runner.get(Game)
+    materialize = single_threaded_runner.get(HallOfFameMaterialize)
+    john, alice = game.register(str(uuid4())), game.register(str(uuid4()))
+    game.add_score(john, 10)
+    game.add_score(alice, 20)
+    # The second rebuild replaces the table created by the first one.
+    for _ in range(2):
+        materialize.rebuild(HallOfFame.name)
+    game.add_score(john, 5)
+    with materialize.engine.begin() as conn:
+        rows = conn.execute(
+            sa.text("SELECT player_id, score FROM high_score WHERE player_id IN (:john, :alice)"),
+            {'john': str(john), 'alice': str(alice)},
+        ).fetchall()
+    assert dict(rows) == {str(john): 15, str(alice): 20}
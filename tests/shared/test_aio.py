@@ -0,0 +1,44 @@
+import asyncio
+from threading import Event
+
+import pytest
+from eventsourcing.application import Application
+
+from seedwork.aio import AsyncApplication
+
+
+def test_max_workers_from_env():
+    assert AsyncApplication(Application(env={'ASYNC_WORKERS': '3'})).max_workers == 3
+    assert AsyncApplication(Application(), max_workers=2).max_workers == 2
+    assert AsyncApplication._get_max_workers({
+        'PERSISTENCE_MODULE': 'eventsourcing.postgres',
+        'POSTGRES_POOL_SIZE': '4',
+        'POSTGRES_MAX_OVERFLOW': '2',
+    }) == 6
+    assert AsyncApplication._get_max_workers({'PERSISTENCE_MODULE': 'eventsourcing.postgres'}) == 15
+
+
+def test_cancel_queued_call():
+    facade = AsyncApplication(Application(), max_workers=1)
+    started, release = Event(), Event()
+    called = []
+
+    def block():
+        started.set()
+        release.wait(5)
+        return 'blocked'
+
+    async def main():
+        running = asyncio.ensure_future(facade.run(block))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        queued = asyncio.ensure_future(facade.run(called.append, 'queued'))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        assert await running == 'blocked'
+
+    asyncio.run(main())
+    facade.close()
+    assert called == []
@@ -0,0 +1,64 @@
+from time import sleep
+from uuid import uuid4
+
+import pytest
+from eventsourcing.domain import (
+    Aggregate,
+    event,
+)
+
+from seedwork.cache import (
+    AggregateCache,
+    CachingApplication,
+)
+
+
+class Dog(Aggregate):
+    def __init__(self):
+        self.tricks = []
+
+    @event('TrickAdded')
+    def add_trick(self, trick: str) -> None:
+        self.tricks.append(trick)
+
+
+class TestAggregateCache:
+    def test_hits_and_misses(self):
+        cache = AggregateCache(maxsize=2)
+        key = uuid4()
+        with pytest.raises(KeyError):
+            cache.get(key)
+        cache.put(key, 'aggregate')
+        assert cache.get(key) == 'aggregate'
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+    def test_evictions(self):
+        cache = AggregateCache(maxsize=2)
+        keys = [uuid4() for _ in range(3)]
+        for key in keys:
+            cache.put(key, str(key))
+        with pytest.raises(KeyError):
+            cache.get(keys[0])
+        assert cache.get(keys[2]) == str(keys[2])
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1}
+
+    def test_ttl(self):
+        cache = AggregateCache(maxsize=2, ttl=0.01)
+        key = uuid4()
+        cache.put(key, 'aggregate')
+        assert cache.get(key) == 'aggregate'
+        sleep(0.02)
+        with pytest.raises(KeyError):
+            cache.get(key)
+        with pytest.raises(KeyError):
+            cache.get(key)
+        assert cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 1}
+
+
+def test_save_puts_a_copy_in_the_cache():
+    app = CachingApplication(env={'AGGREGATE_CACHE_MAXSIZE': '10'})
+    dog = Dog()
+    dog.add_trick('roll over')
+    app.save(dog)
+    dog.add_trick('not saved')
+    assert app.repository.get(dog.id).tricks == ['roll over']
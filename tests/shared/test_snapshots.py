@@ -0,0 +1,156 @@
+from threading import (
+    Event,
+    current_thread,
+)
+from uuid import uuid4
+
+from eventsourcing.domain import (
+    Aggregate,
+    event,
+)
+
+from seedwork.snapshots import (
+    ReplayMetrics,
+    SnapshotPolicy,
+    SnapshottingApplication,
+    SnapshotWorker,
+)
+
+
+class Counter(Aggregate):
+    def __init__(self):
+        self.count = 0
+
+    @event('Incremented')
+    def increment(self):
+        self.count += 1
+
+
+class TestSnapshotPolicy:
+    def test_interval(self):
+        policy = SnapshotPolicy(interval=10)
+        aggregate_id = uuid4()
+        assert not policy.is_due(aggregate_id, 9)
+        assert policy.is_due(aggregate_id, 10)
+        assert policy.is_due(aggregate_id, 12, events=3)
+        assert not policy.is_due(aggregate_id, 12, events=2)
+
+    def test_max_replay_time(self):
+        policy = SnapshotPolicy(max_replay_time=0.5)
+        aggregate_id = uuid4()
+        policy.record_replay(aggregate_id, 0.1)
+        assert not policy.is_due(aggregate_id, 1)
+        policy.record_replay(aggregate_id, 0.6)
+        assert policy.is_due(aggregate_id, 2)
+        policy.snapshot_taken(aggregate_id)
+        assert not policy.is_due(aggregate_id, 3)
+
+    def test_max_size(self):
+        policy = SnapshotPolicy(max_size=100)
+        aggregate_id = uuid4()
+        policy.record_size(aggregate_id, 60)
+        assert not policy.is_due(aggregate_id, 1)
+        policy.record_size(aggregate_id, 60)
+        assert policy.is_due(aggregate_id, 2)
+        policy.snapshot_taken(aggregate_id)
+        assert not policy.is_due(aggregate_id, 3)
+
+    def test_maxsize(self):
+        policy = SnapshotPolicy(max_size=100, maxsize=1)
+        first, second = uuid4(), uuid4()
+        policy.record_size(first, 200)
+        policy.record_size(second, 200)
+        assert not policy.is_due(first, 1)
+        assert policy.is_due(second, 1)
+
+    def test_from_env(self):
+        env = {
+            'HIGH_SCORE_TABLE_SNAPSHOT_INTERVAL': '50',
+            'HIGH_SCORE_TABLE_SNAPSHOT_MAX_REPLAY_TIME': '0.25',
+            'HIGH_SCORE_TABLE_SNAPSHOT_MAX_SIZE': '4096',
+        }
+        policy = SnapshotPolicy.from_env(env, 'HighScoreTable', interval=100)
+        assert (policy.interval, policy.max_replay_time, policy.max_size) == (50, 0.25, 4096)
+        policy = SnapshotPolicy.from_env({}, 'HighScoreTable', interval=100)
+        assert (policy.interval, policy.max_replay_time, policy.max_size) == (100, None, None)
+        policy = SnapshotPolicy.from_env({'HIGH_SCORE_TABLE_SNAPSHOT_INTERVAL': '0'}, 'HighScoreTable', interval=100)
+        assert not policy.is_enabled
+
+
+def test_replay_metrics():
+    metrics = ReplayMetrics()
+    metrics.record('Todo', 0.5, 10)
+    metrics.record('Todo', 0.25, 30)
+    assert metrics.stats() == {
+        'Todo': {'replays': 2, 'events': 40, 'seconds': 0.75, 'max_events': 30, 'max_seconds': 0.5},
+    }
+
+
+class TestSnapshotWorker:
+    def test_replaces_pending_request(self):
+        worker = SnapshotWorker()
+        started, release = Event(), Event()
+        taken = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        aggregate_id = uuid4()
+        worker.put(uuid4(), 1, block)
+        started.wait()
+        worker.put(aggregate_id, 100, lambda: taken.append(100))
+        worker.put(aggregate_id, 200, lambda: taken.append(200))
+        assert worker.put(aggregate_id, 150, lambda: taken.append(150))
+        release.set()
+        worker.join()
+        assert taken == [200]
+        assert worker.stats() == {'pending': 0, 'taken': 2, 'replaced': 1, 'dropped': 0, 'failed': 0}
+
+    def test_drops_requests_over_maxsize(self):
+        worker = SnapshotWorker(maxsize=1)
+        started, release = Event(), Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        worker.put(uuid4(), 1, block)
+        started.wait()
+        assert worker.put(uuid4(), 1, lambda: None)
+        assert not worker.put(uuid4(), 1, lambda: None)
+        release.set()
+        worker.close()
+        assert worker.stats() == {'pending': 0, 'taken': 2, 'replaced': 0, 'dropped': 1, 'failed': 0}
+        assert not worker.put(uuid4(), 1, lambda: None)
+
+    def test_counts_failures(self, caplog):
+        worker = SnapshotWorker()
+        aggregate_id = uuid4()
+        worker.put(aggregate_id, 1, lambda: 1 / 0)
+        worker.join()
+        assert worker.stats()['failed'] == 1
+        [record] = caplog.records
+        assert record.getMessage() == f'Failed to take snapshot of {aggregate_id} at version 1'
+        assert record.exc_info[0] is ZeroDivisionError
+
+
+def test_take_snapshots_gets_state_in_background():
+    application = SnapshottingApplication(env={
+        'IS_SNAPSHOTTING_ENABLED': 'y',
+        'SNAPSHOTTING_IN_BACKGROUND': 'y',
+        'COUNTER_SNAPSHOT_INTERVAL': '2',
+    })
+    counter = Counter()
+    counter.increment()
+    threads = []
+
+    def get_state(aggregate_id):
+        threads.append(current_thread().name)
+        return counter
+
+    recordings = application.save(*counter.collect_events())
+    application.take_snapshots(Counter, recordings, get_state=get_state)
+    application.close()
+    assert threads == ['snapshot-worker']
+    assert [snapshot.originator_version for snapshot in application.snapshots.get(counter.id)] == [2]
@@ -8,6 +8,7 @@ import pytest
 from group.model import (
     GroupCreated,
     GroupMember,
+    GroupMemberAdded,
     Group,
 )
 
@@ -89,3 +90,64 @@ class TestModel:
         parent = create_group()
         group.reassign(parent.__reference__)
         parent.add_member(reference=group.__reference__, name=group.state.name)
+
+    def test_replay(self, create_group):
+        group = create_group(parent_id=uuid4())
+        group.rename('new-test')
+        group.add_member(name='new-member', reference=uuid4())
+        group.reassign(uuid4())
+        group.add_member(name='other-member', reference=uuid4())
+        events = list(group.collect_events())
+
+        copy = Group.replay(events)
+        assert copy == group
+        assert copy.state == group.state
+        assert copy.__version__ == group.__version__ == 5
+
+        snapshot = Group.replay(events[:3])
+        members = snapshot.state.members
+        copy = Group.replay(events[3:], snapshot)
+        assert copy.state == group.state
+        assert len(members) == 1
+
+    def test_add_member_keeps_previous_state(self, create_group):
+        group = create_group()
+        group.add_member(name='first', reference=uuid4())
+        state = group.state
+        group.rename('renamed')
+        assert group.state.members is state.members
+        group.add_member(name='second', reference=uuid4())
+        assert len(state.members) == 1
+        assert len(group.state.members) == 2
+
+    @pytest.mark.parametrize('members', (1000, 10000))
+    def test_load_replay(self, create_group, members):
+        group = create_group()
+        events = list(group.collect_events())
+        events.extend(
+            GroupMemberAdded(
+                originator_reference=group.__reference__,
+                originator_version=version,
+                member=GroupMember(name=str(version), reference=uuid4()),
+            )
+            for version in range(2, members + 2)
+        )
+        copy = Group.replay(events)
+        assert copy.__version__ == members + 1
+        assert len(copy.state.members) == members
+
+    def test_create_event_validates_raw_payload(self, create_group):
+        group = create_group()
+        parent_id = uuid4()
+        group.reassign(str(parent_id))
+        assert group.state.parent_id == parent_id
+        with pytest.raises(ValueError):
+            group.rename(123)
+
+    def test_load_commands(self, create_group):
+        groups = [create_group() for _ in range(100)]
+        for i in range(100):
+            for group in groups:
+                group.rename(f'test-{i}')
+                group.add_member(name=f'member-{i}', reference=uuid4())
+        assert all(len(group.state.members) == 100 for group in groups)
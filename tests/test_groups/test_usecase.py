@@ -7,154 +7,28 @@ import pytest
 from black.trans import defaultdict
 from d3m.core import get_messagebus
 from d3m.domain import get_event_class
-import sqlalchemy as sa
-from d3m.uow import (
-    UnitOfWorkBuilder,
-    IRepository,
-    IRepositoryBuilder,
-    IUnitOfWorkCtxMgr,
-)
-from sqlalchemy import CursorResult
-from sqlalchemy.ext.asyncio import (
-    AsyncEngine,
-    create_async_engine,
-    AsyncConnection,
-)
+from d3m.uow import UnitOfWorkBuilder
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from group.bases import DomainEvent
 from group.model import (
     Group,
     GroupMember,
-    GroupState,
+)
+from group.repository import (
+    GroupReader,
+    GroupRepository,
+    GroupRepositoryBuilder,
 )
 from group.usecase import (
     IGroupRepository,
     collection,
     CreateGroupCommand,
     ProduceGroupCommand,
+    ProduceGroupTreeCommand,
     RenameGroupCommand,
 )
-
-
-class RepositoryBuilder(IRepositoryBuilder):
-
-    def __init__(self, repository_class, engine):
-        self._repository_class = repository_class
-        self._engine = engine
-
-    async def __call__(self, __uow_context_manager: IUnitOfWorkCtxMgr, /) -> IRepository:
-        return self._repository_class(self._engine)
-
-
-class RealRepository(IGroupRepository):
-    def __init__(self, engine: AsyncEngine):
-        self._engine = engine
-        self._seen: dict[UUID, Group] = {}
-
-    def create(self, name: str, parent_id: UUID | None) -> Group:
-        group = Group.create(name, parent_id=parent_id)
-        self._seen[group.__reference__] = group
-        return group
-
-    async def get(self, reference: UUID) -> Group:
-        snapshot = await self._get_snapshot(reference)
-        events = await self._get_events(reference, version=snapshot.__version__ if snapshot else 0)
-        if not snapshot and not events:
-            raise Exception("Not found aggregate")  # todo: Exception
-        for db_event in events:
-            event_cls = get_event_class(db_event['domain'], db_event['name'])
-            event = t.cast(
-                DomainEvent, event_cls.load(
-                    payload=dict(
-                        originator_version=db_event['originator_version'],
-                        originator_reference=db_event['originator_reference'],
-                        **db_event['payload'],
-                    ),
-                    reference=db_event['event_reference'],
-                    timestamp=db_event['timestamp']
-                )
-            )
-            snapshot = event.mutate(snapshot)
-        group = t.cast(Group, snapshot)
-        self._seen[group.__reference__] = group
-        return group
-
-    async def _get_snapshot(self, reference: UUID) -> Group | None:
-        async with self._engine.begin() as conn:
-            cursor: CursorResult = await conn.execute(
-                sa.text(
-                    """
-                    SELECT * FROM group_snapshots
-                    WHERE originator_reference = :originator_reference 
-                    ORDER BY originator_version DESC
-                    LIMIT 1
-                    """
-                ), {'originator_reference': reference}
-            )
-            group_db = cursor.mappings().fetchone()
-            if group_db:
-                return Group(
-                    __version__=group_db['originator_version'],
-                    __reference__=group_db['originator_reference'],
-                    state=GroupState.model_validate(group_db['state']),
-                )
-
-    async def _get_events(self, reference: UUID, version: int):
-        async with self._engine.begin() as conn:
-            cursor: CursorResult = await conn.execute(
-                sa.text(
-                    """
-                    SELECT * FROM group_events
-                    WHERE originator_reference = :originator_reference AND originator_version > :originator_version
-                    ORDER BY originator_version ASC
-                    """
-                ), {'originator_reference': reference, 'originator_version': version}
-            )
-            return cursor.mappings().fetchall()
-
-    async def commit(self) -> None:
-        async with self._engine.begin() as conn:
-            while self._seen:
-                reference, aggregate = self._seen.popitem()
-                for event in aggregate.collect_events():
-                    if event.originator_version % 100 == 0:
-                        await self._save_snapshot(aggregate, conn)
-                    await self._save_event(event, conn)
-            await conn.commit()
-
-    async def _save_snapshot(self, aggregate: Group, conn: AsyncConnection):
-        await conn.execute(
-            sa.text(
-                """
-                    INSERT INTO group_snapshots (originator_reference, domain, name, state, originator_version)
-                    VALUES (:originator_reference, :domain, :name, :state, :originator_version)
-                """
-            ), dict(
-                originator_reference=aggregate.__reference__,
-                originator_version=aggregate.__version__,
-                domain=aggregate.__domain_name__,
-                name=aggregate.__class__.__name__,
-                state=aggregate.state.model_dump_json(),
-            )
-        )
-
-    async def _save_event(self, event: DomainEvent, conn: AsyncConnection):
-        await conn.execute(
-            sa.text(
-                """
-                    INSERT INTO group_events (originator_reference, timestamp, domain, name, payload, originator_version, event_reference)
-                    VALUES (:originator_reference, :timestamp, :domain, :name, :payload, :originator_version, :event_reference)
-                """
-            ), dict(
-                originator_reference=event.originator_reference,
-                originator_version=event.originator_version,
-                event_reference=event.__reference__,
-                timestamp=event.__timestamp__,
-                domain=event.__domain_name__,
-                name=event.__class__.__name__,
-                payload=event.model_dump_json(),
-            )
-        )
+from seedwork.snapshots import SnapshotPolicy
 
 
 class FakeRepository(IGroupRepository):
@@ -218,7 +92,7 @@ class TestUsecase:
     async def messagebus(self, fake_engine, real_engine):
         mb = get_messagebus()
         mb.include_collection(collection)
-        uow_builder = UnitOfWorkBuilder(RepositoryBuilder(RealRepository, real_engine))
+        uow_builder = UnitOfWorkBuilder(GroupRepositoryBuilder(real_engine))
         mb.set_defaults(
             'group',
             uow_builder=uow_builder,
@@ -268,3 +142,93 @@ class TestUsecase:
         assert member.__version__ == 1
         assert member.state.members == {}
         assert member.state.parent_id == parent_id
+
+    async def test_load_get(self, setup):
+        group_id = await self._messagebus.handle_message(CreateGroupCommand(name='test'))
+        for i in range(250):
+            await self._messagebus.handle_message(RenameGroupCommand(reference=group_id, name=f'test-{i}'))
+        for _ in range(1000):
+            aggregate = await self._messagebus.handle_message(ProduceGroupCommand(reference=group_id))
+            assert aggregate.__version__ == 251
+
+    async def test_load_create_with_parent(self, setup):
+        parent_id = await self._messagebus.handle_message(CreateGroupCommand(name='test'))
+        for i in range(1000):
+            await self._messagebus.handle_message(CreateGroupCommand(name=f'member-{i}', parent_id=parent_id))
+        parent = await self._messagebus.handle_message(ProduceGroupCommand(reference=parent_id))
+        assert len(parent.state.members) == 1000
+
+    async def test_produce_tree(self, setup):
+        root_id = await self._messagebus.handle_message(CreateGroupCommand(name='root'))
+        child_id = await self._messagebus.handle_message(CreateGroupCommand(name='child', parent_id=root_id))
+        leaf_id = await self._messagebus.handle_message(CreateGroupCommand(name='leaf', parent_id=child_id))
+        other_id = await self._messagebus.handle_message(CreateGroupCommand(name='other', parent_id=root_id))
+        tree = await self._messagebus.handle_message(ProduceGroupTreeCommand(reference=root_id))
+        assert list(tree) == [root_id, child_id, other_id, leaf_id]
+        assert tree[leaf_id].state.parent_id == child_id
+
+    async def test_load_produce_tree(self, setup):
+        root_id = await self._messagebus.handle_message(CreateGroupCommand(name='root'))
+        level = [root_id]
+        for depth in range(3):
+            level = [
+                await self._messagebus.handle_message(CreateGroupCommand(name=f'{depth}-{i}', parent_id=parent_id))
+                for parent_id in level
+                for i in range(10)
+            ]
+        tree = await self._messagebus.handle_message(ProduceGroupTreeCommand(reference=root_id))
+        assert len(tree) == 1111
+
+    async def test_produce_with_reader(self, real_engine):
+        reader = GroupReader(real_engine)
+        repository_builder = GroupRepositoryBuilder(real_engine)
+        mb = get_messagebus()
+        mb.include_collection(collection)
+        mb.set_defaults('group', uow_builder=UnitOfWorkBuilder(repository_builder), group_reader=reader)
+        await mb.run()
+        try:
+            root_id = await mb.handle_message(CreateGroupCommand(name='root'))
+            child_id = await mb.handle_message(CreateGroupCommand(name='child', parent_id=root_id))
+            group = await mb.handle_message(ProduceGroupCommand(reference=child_id))
+            tree = await mb.handle_message(ProduceGroupTreeCommand(reference=root_id))
+        finally:
+            await mb.close()
+        assert group.state.parent_id == root_id
+        assert list(tree) == [root_id, child_id]
+        # Only creating the child loads a group in a unit of work, the queries go through the reader.
+        assert repository_builder.replay_metrics.stats()['Group']['replays'] == 1
+        assert reader.replay_metrics.stats()['Group']['replays'] == 3
+
+    async def test_reader(self, setup, real_engine):
+        reader = GroupReader(real_engine, cache_maxsize=10)
+        group_id = await self._messagebus.handle_message(CreateGroupCommand(name='test'))
+        group = await reader.get(group_id)
+        group.rename('local')
+        await self._messagebus.handle_message(RenameGroupCommand(reference=group_id, name='new'))
+        group = await reader.get(group_id)
+        assert group.__version__ == 2
+        assert group.state.name == 'new'
+
+    @pytest.mark.parametrize('cache_maxsize', (None, 100))
+    async def test_load_reader(self, setup, real_engine, cache_maxsize):
+        reader = GroupReader(real_engine, cache_maxsize=cache_maxsize)
+        group_id = await self._messagebus.handle_message(CreateGroupCommand(name='test'))
+        for i in range(250):
+            await self._messagebus.handle_message(RenameGroupCommand(reference=group_id, name=f'test-{i}'))
+        for _ in range(1000):
+            group = await reader.get(group_id)
+            assert group.__version__ == 251
+
+    async def test_snapshot_max_size(self, real_engine):
+        policy = SnapshotPolicy(max_size=200)
+        repository = GroupRepository(real_engine, snapshot_policy=policy)
+        group_id = repository.create('test', None).__reference__
+        await repository.commit()
+        for i in range(30):
+            repository = GroupRepository(real_engine, snapshot_policy=policy, replay_metrics=repository.replay_metrics)
+            group = await repository.get(group_id)
+            group.rename(f'test-{i}')
+            await repository.commit()
+        stats = repository.replay_metrics.stats()['Group']
+        assert stats['replays'] == 30
+        assert stats['max_events'] < 30
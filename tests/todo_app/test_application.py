@@ -1,4 +1,6 @@
+import asyncio
 import uuid
+from time import perf_counter
 from uuid import UUID
 
 import pytest
@@ -8,13 +10,18 @@ from eventsourcing.application import (
 )
 
 from todo.application import (
+    AsyncTodoApp,
     TodoApp,
 )
 from todo.abstractions import ITodoApp
 from todo.domainmodel import (
     Item,
     ItemStatus,
+    Todo,
+    TodoDeltaSnapshot,
+    project_todo,
 )
+from todo.seedwork import Snapshot
 
 
 class TestApplication:
@@ -66,4 +73,173 @@ class TestApplication:
         item_id = application.add_item(todo_id, 'Milk')
         application.done_item(todo_id, item_id)
         todo = application.get_todo(todo_id)
-        assert todo.collect_items() == [Item(title="Milk", status=ItemStatus.DONE)]
\ No newline at end of file
+        assert todo.collect_items() == [Item(title="Milk", status=ItemStatus.DONE)]
+
+    def test_with_cache(self):
+        application = TodoApp(env={'AGGREGATE_CACHE_MAXSIZE': '10'})
+        todo_id = application.create_todo('Orders')
+        milk_id = application.add_item(todo_id, 'Milk')
+        bread_id = application.add_item(todo_id, 'Bread')
+        application.add_item(todo_id, 'Soap')
+        application.done_item(todo_id, milk_id)
+        application.remove_item(todo_id, bread_id)
+        todo = application.get_todo(todo_id)
+        assert todo.version == 6
+        assert todo.collect_items() == [
+            Item(title="Milk", status=ItemStatus.DONE),
+            Item(title="Soap", status=ItemStatus.CREATED),
+        ]
+        assert application.repository.cache.stats()['hits'] == 5
+
+
+def test_snapshot_max_size():
+    application = TodoApp(env={'TODO_SNAPSHOT_INTERVAL': '0', 'TODO_SNAPSHOT_MAX_SIZE': '1000'})
+    todo_id = application.create_todo('Orders')
+    for i in range(20):
+        application.add_item(todo_id, f'Item {i}')
+    assert application.snapshot_worker is None
+    snapshots = list(application.snapshots.get(todo_id))
+    assert snapshots
+    assert all(snapshot.originator_version <= 21 for snapshot in snapshots)
+    assert len(application.get_todo(todo_id).collect_items()) == 20
+    # The snapshots are taken from the projected todos, without replays.
+    assert application.replay_metrics.stats()['Todo']['replays'] == 21
+
+
+def test_snapshot_in_background():
+    application = TodoApp(env={'TODO_SNAPSHOT_INTERVAL': '10', 'SNAPSHOTTING_IN_BACKGROUND': 'y'})
+    todo_id = application.create_todo('Orders')
+    item_ids = [application.add_item(todo_id, f'Item {i}') for i in range(19)]
+    application.done_item(todo_id, item_ids[0])
+    application.remove_item(todo_id, item_ids[1])
+    application.close()
+    # A pending request for version 10 may be replaced by the one for version 20.
+    assert [snapshot.originator_version for snapshot in application.snapshots.get(todo_id)][-1] == 20
+    todo = application.get_todo(todo_id)
+    assert application.repository.get(todo_id, version=20, projector_func=project_todo) == todo
+    assert todo.items[item_ids[0]].status == ItemStatus.DONE
+    assert item_ids[1] not in todo.items
+
+
+@pytest.mark.parametrize('in_background', ('n', 'y'))
+def test_load_add_item_latency(in_background, record_property):
+    application = TodoApp(env={
+        'SNAPSHOTTING_IN_BACKGROUND': in_background,
+        'AGGREGATE_CACHE_MAXSIZE': '10',
+        'DEEPCOPY_FROM_AGGREGATE_CACHE': 'n',
+    })
+    todo_id = application.create_todo('Orders')
+    latencies = {}
+    for i in range(2000):
+        started = perf_counter()
+        application.add_item(todo_id, f'Item {i}')
+        latencies[i + 2] = perf_counter() - started
+    application.close()
+    snapshotting = sorted(latency for version, latency in latencies.items() if version % 100 == 0)
+    ordered = sorted(latencies.values())
+    record_property('p99_seconds', ordered[1980])
+    record_property('median_snapshot_due_seconds', snapshotting[len(snapshotting) // 2])
+    assert list(application.snapshots.get(todo_id))[-1].originator_version == 2000
+
+
+@pytest.mark.parametrize('transcoder_topic', ('', 'todo.transcoders:MsgpackTranscoder'))
+def test_delta_snapshots(transcoder_topic):
+    application = TodoApp(env={
+        'TODO_SNAPSHOT_INTERVAL': '10',
+        'SNAPSHOTTING_IN_BACKGROUND': 'n',
+        'DELTA_SNAPSHOT_RATIO': '1.5',
+        'TRANSCODER_TOPIC': transcoder_topic,
+    })
+    todo_id = application.create_todo('Orders')
+    item_ids = [application.add_item(todo_id, f'Item {i}') for i in range(19)]
+    application.done_item(todo_id, item_ids[0])
+    application.remove_item(todo_id, item_ids[1])
+    for i in range(18):
+        application.add_item(todo_id, f'More {i}')
+    snapshots = list(application.snapshots.get(todo_id))
+    assert [type(snapshot) for snapshot in snapshots] == [Snapshot, TodoDeltaSnapshot, Snapshot, TodoDeltaSnapshot]
+    assert [snapshot.base.originator_version for snapshot in snapshots[1::2]] == [10, 30]
+    todo = application.get_todo(todo_id)
+    for version in (20, 40):
+        loaded = application.repository.get(todo_id, version=version, projector_func=project_todo)
+        assert loaded.model_dump() == project_todo(None, application.events.get(todo_id, lte=version)).model_dump()
+    assert todo.items[item_ids[0]].status == ItemStatus.DONE
+    assert item_ids[1] not in todo.items
+
+
+@pytest.mark.parametrize('ratio', ('0', '0.5'))
+def test_load_delta_snapshots(ratio, record_property):
+    application = TodoApp(env={
+        'DELTA_SNAPSHOT_RATIO': ratio,
+        'SNAPSHOTTING_IN_BACKGROUND': 'n',
+        'AGGREGATE_CACHE_MAXSIZE': '10',
+        'DEEPCOPY_FROM_AGGREGATE_CACHE': 'n',
+    })
+    todo_id = application.create_todo('Orders')
+    application.save(*(
+        Todo.model_construct(id=todo_id, version=version).add_item(str(version))
+        for version in range(1, 10000)
+    ))
+    for i in range(200):
+        application.add_item(todo_id, f'Item {i}')
+    stored = application.snapshots.recorder.select_events(todo_id, desc=True, limit=1)[0]
+    started = perf_counter()
+    for _ in range(5):
+        todo = application.repository.get(todo_id, version=10200, projector_func=project_todo)
+    record_property('load_seconds', (perf_counter() - started) / 5)
+    record_property('snapshot_bytes', len(stored.state))
+    assert stored.originator_version == 10200
+    assert len(todo.items) == 10199
+
+
+def test_async_todo_app():
+    application = AsyncTodoApp(TodoApp(), max_workers=2)
+
+    async def main():
+        todo_id = await application.create_todo('Orders')
+        item_ids = await asyncio.gather(*(application.add_item(todo_id, f'Item {i}') for i in range(10)))
+        await application.done_item(todo_id, item_ids[0])
+        await application.remove_item(todo_id, item_ids[1])
+        await application.add_items(todo_id, ['More 0', 'More 1'])
+        return item_ids, await application.get_todo(todo_id)
+
+    item_ids, todo = asyncio.run(main())
+    application.close()
+    assert len(todo.items) == 11
+    assert todo.items[item_ids[0]].status == ItemStatus.DONE
+    assert item_ids[1] not in todo.items
+
+
+@pytest.mark.parametrize('max_workers', (1, 4, 16))
+def test_load_concurrent_requests(max_workers, record_property):
+    """
+    Clients send requests one after another, as HTTP clients with keep-alive
+    connections would, to the todos of 10 users.
+    """
+    clients, requests = 64, 20
+    application = AsyncTodoApp(
+        TodoApp(env={'AGGREGATE_CACHE_MAXSIZE': '100', 'DEEPCOPY_FROM_AGGREGATE_CACHE': 'n'}),
+        max_workers=max_workers,
+    )
+    latencies = []
+
+    async def client(todo_id, index):
+        for i in range(requests):
+            started = perf_counter()
+            await application.add_item(todo_id, f'Item {index}-{i}')
+            latencies.append(perf_counter() - started)
+
+    async def main():
+        todo_ids = [await application.create_todo(f'User {i}') for i in range(10)]
+        started = perf_counter()
+        await asyncio.gather(*(client(todo_ids[i % 10], i) for i in range(clients)))
+        return todo_ids, perf_counter() - started
+
+    todo_ids, seconds = asyncio.run(main())
+    todos = [application.app.get_todo(todo_id) for todo_id in todo_ids]
+    application.close()
+    latencies.sort()
+    record_property('requests_per_second', len(latencies) / seconds)
+    record_property('p50_seconds', latencies[len(latencies) // 2])
+    record_property('p99_seconds', latencies[len(latencies) * 99 // 100])
+    assert sum(len(todo.items) for todo in todos) == clients * requests
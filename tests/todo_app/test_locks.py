@@ -0,0 +1,81 @@
+import threading
+from time import sleep
+
+import pytest
+
+from todo.abstractions import ILock
+from todo.locks import (
+    FileLock,
+    StripedLock,
+)
+
+
+@pytest.fixture(params=('striped', 'file'))
+def make_lock(request, tmp_path):
+    def wrapper():
+        if request.param == 'file':
+            return FileLock(str(tmp_path / 'locks'), stripes=8)
+        return StripedLock(stripes=8)
+
+    return wrapper
+
+
+def test_is_lock(make_lock):
+    lock = make_lock()
+    assert isinstance(lock, ILock)
+    with lock:
+        with lock('todo-1'):
+            pass
+    assert lock.stats.stats()['acquired'] == 2
+
+
+def test_excludes_holders_of_same_key(make_lock):
+    lock = make_lock()
+    holders = []
+    overlaps = []
+
+    def hold():
+        for _ in range(20):
+            with lock('todo-1'):
+                holders.append(1)
+                overlaps.append(len(holders))
+                sleep(0.0005)
+                holders.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlaps) == 1
+    stats = lock.stats.stats()
+    assert stats['acquired'] == 80
+    assert stats['contended'] > 0
+    assert stats['wait_seconds'] > 0
+    assert stats['max_hold_seconds'] >= 0.0005
+
+
+def test_bounded_stripes():
+    lock = StripedLock(stripes=4)
+    assert {lock.get_stripe(f'todo-{i}') for i in range(100)} == {0, 1, 2, 3}
+    assert lock.get_stripe('todo-1') == StripedLock(stripes=4).get_stripe('todo-1')
+
+
+def test_file_lock_excludes_other_instances(tmp_path):
+    first = FileLock(str(tmp_path), stripes=4)
+    second = FileLock(str(tmp_path), stripes=4)
+    acquired = threading.Event()
+
+    def hold():
+        with second('todo-1'):
+            acquired.set()
+
+    with first('todo-1'):
+        thread = threading.Thread(target=hold)
+        thread.start()
+        assert not acquired.wait(0.05)
+    thread.join()
+    assert acquired.is_set()
+    assert second.stats.stats()['contended'] == 1
+    first.close()
+    second.close()
@@ -0,0 +1,57 @@
+from time import perf_counter
+from uuid import uuid4
+
+import pytest
+from eventsourcing.cipher import AESCipher
+from eventsourcing.compressor import ZlibCompressor
+from eventsourcing.persistence import JSONTranscoder
+from eventsourcing.utils import Environment
+
+from todo.domainmodel import (
+    Todo,
+    mutate,
+)
+from todo.mappers import PydanticMapper
+from todo.seedwork import Snapshot
+
+
+def create_events():
+    created = Todo.create('Goods')
+    todo = mutate(created, None)
+    item_added = todo.add_item('Milk')
+    todo = mutate(item_added, todo)
+    item_marked_down = todo.mark_done(item_added.item.create_id())
+    todo = mutate(item_marked_down, todo)
+    item_removed = todo.remove_item(uuid4())
+    return [created, item_added, item_marked_down, item_removed, Snapshot.take(todo)]
+
+
+class TestMapper:
+    @pytest.fixture
+    def mapper(self):
+        return PydanticMapper(transcoder=JSONTranscoder())
+
+    @pytest.fixture
+    def compressed_mapper(self):
+        env = Environment(env={'CIPHER_KEY': AESCipher.create_key(num_bytes=32)})
+        return PydanticMapper(transcoder=JSONTranscoder(), compressor=ZlibCompressor(), cipher=AESCipher(env))
+
+    @pytest.mark.parametrize('event', create_events(), ids=lambda e: type(e).__name__)
+    def test_round_trip(self, mapper, compressed_mapper, event):
+        for m in (mapper, compressed_mapper):
+            copy = m.to_domain_event(m.to_stored_event(event))
+            assert type(copy) is type(event)
+            assert copy.model_dump(mode='json') == event.model_dump(mode='json')
+
+    @pytest.mark.parametrize('event', create_events(), ids=lambda e: type(e).__name__)
+    def test_stored_state_is_json(self, mapper, event):
+        stored = mapper.to_stored_event(event)
+        assert JSONTranscoder().decode(stored.state) == event.model_dump(mode='json')
+
+    @pytest.mark.parametrize('event', create_events(), ids=lambda e: type(e).__name__)
+    def test_load(self, mapper, event, record_property):
+        started = perf_counter()
+        for _ in range(100):
+            copy = mapper.to_domain_event(mapper.to_stored_event(event))
+        record_property('round_trip_seconds', (perf_counter() - started) / 100)
+        assert copy.model_dump(mode='json') == event.model_dump(mode='json')
@@ -5,12 +5,17 @@ import pytest
 
 from todo.domainmodel import (
     Todo,
+    TodoDeltaSnapshot,
     Created,
     Item,
     ItemStatus,
     mutate,
+    project_todo,
+)
+from todo.seedwork import (
+    Aggregate,
+    Snapshot,
 )
-from todo.seedwork import Aggregate
 
 
 class TestModel:
@@ -101,3 +106,58 @@ class TestModel:
         todo = mutate(todo.add_item(item.title), todo)
         todo = mutate(todo.mark_done(item.create_id()), todo)
         assert todo.collect_items() == [item]
+
+    def test_mark_done_keeps_previous_todo(self, get_todo, get_item):
+        todo = get_todo()
+        item = get_item()
+        item_added = todo.add_item(item.title)
+        todo = mutate(item_added, todo)
+        done = mutate(todo.mark_done(item.create_id()), todo)
+        assert done.collect_items() == [Item(title=item.title, status=ItemStatus.DONE)]
+        assert todo.collect_items() == [item]
+        assert item_added.item == item
+
+    def test_project_todo(self, get_todo, get_item):
+        first, second = get_item(), get_item()
+        todo = get_todo()
+        events = [
+            todo.add_item(first.title),
+            todo.add_item(second.title),
+            todo.mark_done(first.create_id()),
+            todo.remove_item(second.create_id()),
+        ]
+        projected = project_todo(todo, events)
+        for event in events:
+            todo = mutate(event, todo)
+        assert projected == todo
+        assert projected.collect_items() == [Item(title=first.title, status=ItemStatus.DONE)]
+
+    def test_delta_snapshot(self, get_todo, get_item):
+        first, second, third = get_item(), get_item(), get_item()
+        base = get_todo()
+        base = project_todo(base, [base.add_item(first.title), base.add_item(second.title)])
+        todo = project_todo(base, [
+            base.add_item(third.title),
+            base.mark_done(first.create_id()),
+            base.remove_item(second.create_id()),
+        ])
+        snapshot = TodoDeltaSnapshot.take(todo, base)
+        assert snapshot.changes == 3
+        assert snapshot.base_version == base.version
+        assert set(snapshot.state['items']) == {first.create_id(), third.create_id()}
+        with pytest.raises(ValueError):
+            project_todo(None, [snapshot])
+        snapshot.base = Snapshot.take(base)
+        assert project_todo(None, [snapshot]).model_dump() == todo.model_dump()
+
+    @pytest.mark.parametrize('items', (1000, 10000, 100000))
+    def test_load_replay(self, register_todo, items):
+        created = register_todo()
+        events = [created]
+        events.extend(
+            Todo.model_construct(id=created.originator_id, version=version).add_item(str(version))
+            for version in range(1, items + 1)
+        )
+        todo = project_todo(None, events)
+        assert todo.version == items + 1
+        assert len(todo.items) == items
@@ -1,18 +1,36 @@
-from unittest.mock import create_autospec
+import threading
+import uuid
+from time import perf_counter
+from unittest.mock import (
+    Mock,
+    create_autospec,
+)
 from uuid import (
     UUID,
 )
 
 import pytest
+from eventsourcing.application import AggregateNotFoundError
+from eventsourcing.persistence import IntegrityError
 
 from todo.application import (
     TodoApp,
 )
+from todo.domainmodel import (
+    Item,
+    ItemStatus,
+    Todo,
+)
 from todo.abstractions import ILock
+from todo.locks import (
+    FileLock,
+    StripedLock,
+)
 from todo.service import (
     TodoService,
     CreateTodoCmd,
     AddItemCmd,
+    RetryPolicy,
 )
 
 
@@ -43,3 +61,110 @@ class TestService:
         todo_id = service.handle(CreateTodoCmd(title='test'))
         item_id = service.handle(AddItemCmd(todo_id=todo_id, title='Bread'))
         assert item_id == UUID('50d9ef4e-b0e8-5070-a9c6-be0abf7220a9')
+
+    @pytest.mark.parametrize('retry', (None, RetryPolicy()))
+    def test_handle_many(self, app, lock, retry):
+        service = TodoService(app, lock, retry=retry)
+        first = service.handle(CreateTodoCmd(title='first'))
+        missing = uuid.uuid4()
+        results = service.handle_many([
+            AddItemCmd(todo_id=first, title='Milk'),
+            AddItemCmd(todo_id=missing, title='Soap'),
+            CreateTodoCmd(title='second'),
+            AddItemCmd(todo_id=first, title='Bread'),
+            AddItemCmd(todo_id=Todo.create_id('second'), title='Eggs'),
+            AddItemCmd(todo_id=first, title='Tea'),
+        ])
+        assert isinstance(results[1], AggregateNotFoundError)
+        assert results[2] == Todo.create_id('second')
+        assert app.get_todo(first).collect_items() == [
+            Item(title=title, status=ItemStatus.CREATED) for title in ('Milk', 'Bread', 'Tea')
+        ]
+        assert [item.create_id() for item in app.get_todo(first).collect_items()] == [
+            results[0], results[3], results[5]
+        ]
+        assert app.get_todo(results[2]).collect_items()[0].create_id() == results[4]
+        assert app.get_todo(first).version == 4
+
+
+@pytest.mark.parametrize('lock_class', ('striped', 'file'))
+@pytest.mark.parametrize('hot', (True, False))
+def test_load_add_item_threads(tmp_path, lock_class, hot, record_property):
+    app = TodoApp(env={'AGGREGATE_CACHE_MAXSIZE': '100', 'DEEPCOPY_FROM_AGGREGATE_CACHE': 'n'})
+    lock = FileLock(str(tmp_path)) if lock_class == 'file' else StripedLock()
+    service = TodoService(app, lock)
+    threads_count, commands = 8, 200
+    todo_ids = [service.handle(CreateTodoCmd(title=f'todo-{i}')) for i in range(threads_count)]
+
+    def add_items(todo_id, writer):
+        for i in range(commands):
+            service.handle(AddItemCmd(todo_id=todo_id, title=f'{writer}-{i}'))
+
+    threads = [
+        threading.Thread(target=add_items, args=(todo_ids[0] if hot else todo_ids[i], i))
+        for i in range(threads_count)
+    ]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    record_property('commands_per_second', threads_count * commands / elapsed)
+    record_property('lock_stats', lock.stats.stats())
+    items = sum(len(app.get_todo(todo_id).items) for todo_id in todo_ids)
+    assert items == threads_count * commands
+
+
+def test_retry_policy():
+    retry = RetryPolicy(attempts=3, base_delay=0)
+    command = Mock(side_effect=[IntegrityError(), IntegrityError(), 'saved'])
+    assert retry(command, 'todo', title='Milk') == 'saved'
+    assert command.call_count == 3
+    command = Mock(side_effect=IntegrityError())
+    with pytest.raises(IntegrityError):
+        retry(command)
+    assert retry.stats() == {'conflicts': 5, 'exhausted': 1}
+
+
+@pytest.mark.parametrize('writers', (1, 8, 64))
+@pytest.mark.parametrize('mode', ('lock', 'retry'))
+def test_load_hot_todo_writers(mode, writers, record_property):
+    app = TodoApp(env={'AGGREGATE_CACHE_MAXSIZE': '100', 'DEEPCOPY_FROM_AGGREGATE_CACHE': 'n'})
+    retry = RetryPolicy(attempts=100) if mode == 'retry' else None
+    service = TodoService(app, retry=retry)
+    todo_id = service.handle(CreateTodoCmd(title='hot'))
+    commands = 640 // writers
+
+    def add_items(writer):
+        for i in range(commands):
+            service.handle(AddItemCmd(todo_id=todo_id, title=f'{writer}-{i}'))
+
+    threads = [threading.Thread(target=add_items, args=(writer,)) for writer in range(writers)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    record_property('commands_per_second', 640 / elapsed)
+    if retry:
+        record_property('retry_stats', retry.stats())
+    assert len(app.get_todo(todo_id).items) == 640
+
+
+@pytest.mark.parametrize('batch', (False, True))
+def test_load_handle_many(batch, record_property):
+    app = TodoApp()
+    service = TodoService(app)
+    todo_ids = [service.handle(CreateTodoCmd(title=f'todo-{i}')) for i in range(20)]
+    commands = [AddItemCmd(todo_id=todo_id, title=f'item-{i}') for i in range(50) for todo_id in todo_ids]
+    started = perf_counter()
+    if batch:
+        results = service.handle_many(commands)
+    else:
+        results = [service.handle(command) for command in commands]
+    record_property('commands_per_second', len(commands) / (perf_counter() - started))
+    assert len(set(results)) == 50
+    assert all(app.get_todo(todo_id).version == 51 for todo_id in todo_ids)
+
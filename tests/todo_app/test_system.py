@@ -1,15 +1,23 @@
+from time import perf_counter
 from uuid import uuid4
 
 import pytest
+import sqlalchemy as sa
 from eventsourcing.postgres import PostgresDatastore
 from eventsourcing.system import (
     System,
     MultiThreadedRunner,
+    SingleThreadedRunner,
 )
 from eventsourcing.tests.postgres_utils import drop_postgres_table
+from sqlalchemy import create_engine
 
 from todo.application import TodoApp
-from todo.domainmodel import Item
+from todo.domainmodel import (
+    Item,
+    ItemStatus,
+)
+from todo.system import TodoMaterialize
 
 
 @pytest.fixture
@@ -172,3 +180,101 @@ def test_with_pg_no_clear(multithread_persistence_runner):
         Item(title='Bananas', status='CREATED'),
         Item(title='Sugar', status='DONE'),
     ]
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'todos.db'}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize('batch_size', ('1', '50'))
+@pytest.mark.parametrize('transcoder_topic', ('', 'todo.transcoders:MsgpackTranscoder'))
+def test_materialize(sqlite_engine, batch_size, transcoder_topic):
+    runner = SingleThreadedRunner(
+        System(pipes=[[TodoApp, TodoMaterialize]]),
+        env={'postgresql_engine': sqlite_engine, 'BATCH_SIZE': batch_size, 'TRANSCODER_TOPIC': transcoder_topic},
+    )
+    runner.start()
+    try:
+        app = runner.get(TodoApp)
+        shopping_id = app.create_todo('Shopping')
+        work_id = app.create_todo('Work')
+        app.create_todo('Empty')
+        sugar_id, bread_id, milk_id = app.add_items(shopping_id, ['Sugar', 'Bread', 'Milk'])
+        report_id = app.add_item(work_id, 'Report')
+        app.done_item(shopping_id, sugar_id)
+        app.remove_item(shopping_id, bread_id)
+        app.done_item(work_id, report_id)
+        # Added again, the item is undone as in the aggregate.
+        app.add_item(shopping_id, 'Sugar')
+        app.done_item(shopping_id, milk_id)
+        materialize = runner.get(TodoMaterialize)
+        materialize.flush()
+
+        assert materialize.recorder.max_tracking_id(TodoApp.name) == 12
+        assert materialize.get_items(shopping_id) == app.get_todo(shopping_id).items
+        assert materialize.get_items(shopping_id, ItemStatus.DONE) == {milk_id: Item(title='Milk', status='DONE')}
+        assert materialize.count_items(shopping_id) == {ItemStatus.CREATED: 1, ItemStatus.DONE: 1}
+        assert materialize.count_items(work_id) == {ItemStatus.CREATED: 0, ItemStatus.DONE: 1}
+        assert materialize.count_items(uuid4()) is None
+        assert materialize.get_todo_ids(ItemStatus.CREATED) == [shopping_id]
+        assert sorted(materialize.get_todo_ids(ItemStatus.DONE)) == sorted([shopping_id, work_id])
+        assert materialize.count_todos(ItemStatus.DONE) == 2
+    finally:
+        runner.stop()
+
+
+def test_materialize_replayed_batch(sqlite_engine):
+    app = TodoApp()
+    todo_id = app.create_todo('Shopping')
+    item_ids = app.add_items(todo_id, [str(i) for i in range(10)])
+    app.done_item(todo_id, item_ids[0])
+    app.remove_item(todo_id, item_ids[1])
+    materialize = TodoMaterialize(env={'postgresql_engine': sqlite_engine, 'BATCH_SIZE': '100'})
+    materialize.follow(TodoApp.name, app.notification_log)
+    materialize.pull_and_process(TodoApp.name)
+    # As if the rows were written but not the tracking.
+    materialize.pull_and_process(TodoApp.name, start=1)
+
+    assert materialize.count_items(todo_id) == {ItemStatus.CREATED: 8, ItemStatus.DONE: 1}
+    assert materialize.get_items(todo_id) == app.get_todo(todo_id).items
+
+
+def test_materialize_create_table(sqlite_engine):
+    TodoMaterialize(env={'postgresql_engine': sqlite_engine, 'TODO_MATERIALIZE_CREATE_TABLE': 'n'})
+    assert sa.inspect(sqlite_engine).get_table_names() == []
+    # CREATE_TABLE of the recorders does not apply to the tables of the view.
+    TodoMaterialize(env={'postgresql_engine': sqlite_engine, 'CREATE_TABLE': 'n'})
+    assert sa.inspect(sqlite_engine).get_table_names() == ['todo_items', 'todos']
+
+def test_load_materialized_reads(sqlite_engine, record_property):
+    app = TodoApp()
+    todo_ids = [app.create_todo(f'User {i}') for i in range(20)]
+    for i, todo_id in enumerate(todo_ids):
+        item_ids = app.add_items(todo_id, [f'Item {j}' for j in range(200)])
+        if i % 2:
+            for item_id in item_ids:
+                app.done_item(todo_id, item_id)
+    materialize = TodoMaterialize(env={'postgresql_engine': sqlite_engine, 'BATCH_SIZE': '1000'})
+    materialize.follow(TodoApp.name, app.notification_log)
+    started = perf_counter()
+    materialize.pull_and_process(TodoApp.name)
+    processed = perf_counter() - started
+
+    started = perf_counter()
+    replayed = [
+        todo_id for todo_id in todo_ids
+        if any(item.status == ItemStatus.CREATED for item in app.get_todo(todo_id).items.values())
+    ]
+    replay = perf_counter() - started
+    started = perf_counter()
+    undone = materialize.get_todo_ids(ItemStatus.CREATED)
+    counts = [materialize.count_items(todo_id) for todo_id in todo_ids]
+    query = perf_counter() - started
+    record_property('process_seconds', processed)
+    record_property('replay_seconds', replay)
+    record_property('query_seconds', query)
+    assert sorted(undone) == sorted(replayed)
+    assert sum(count[ItemStatus.DONE] for count in counts) == 2000
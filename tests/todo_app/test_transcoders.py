@@ -0,0 +1,74 @@
+import datetime as dt
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+from eventsourcing.persistence import (
+    DecimalAsStr,
+    JSONTranscoder,
+)
+
+from todo.application import TodoApp
+from todo.domainmodel import (
+    Item,
+    ItemStatus,
+    Todo,
+    mutate,
+)
+from todo.mappers import PydanticMapper
+from todo.transcoders import MsgpackTranscoder
+
+
+class TestMsgpackTranscoder:
+    @pytest.fixture
+    def transcoder(self):
+        transcoder = MsgpackTranscoder()
+        transcoder.register(DecimalAsStr())
+        return transcoder
+
+    @pytest.mark.parametrize('value', (
+            uuid4(),
+            dt.datetime.now(tz=dt.timezone.utc),
+            ItemStatus.DONE,
+            Decimal('1.5'),
+            {'items': {uuid4(): {'title': 'Milk', 'status': ItemStatus.CREATED}}},
+    ))
+    def test_round_trip(self, transcoder, value):
+        assert transcoder.decode(transcoder.encode(value)) == value
+
+    def test_not_serializable(self, transcoder):
+        with pytest.raises(TypeError):
+            transcoder.encode(object())
+
+    def test_smaller_than_json(self, transcoder):
+        todo = mutate(Todo.create('Goods'), None)
+        event = todo.add_item('Milk')
+        binary = PydanticMapper(transcoder=transcoder).to_stored_event(event)
+        json = PydanticMapper(transcoder=JSONTranscoder()).to_stored_event(event)
+        assert len(binary.state) < len(json.state)
+        assert PydanticMapper(transcoder=transcoder).to_domain_event(binary) == event
+
+
+class TestApplication:
+    @pytest.fixture(params=('', 'todo.transcoders:MsgpackTranscoder'))
+    def application(self, request):
+        return TodoApp(env={
+            'TRANSCODER_TOPIC': request.param,
+            'COMPRESSOR_TOPIC': 'eventsourcing.compressor:ZlibCompressor',
+        })
+
+    def test_items(self, application):
+        todo_id = application.create_todo('Orders')
+        milk_id = application.add_item(todo_id, 'Milk')
+        application.add_item(todo_id, 'Bread')
+        application.done_item(todo_id, milk_id)
+        assert application.get_todo(todo_id).collect_items() == [
+            Item(title='Milk', status=ItemStatus.DONE),
+            Item(title='Bread', status=ItemStatus.CREATED),
+        ]
+
+    def test_load(self, application):
+        todo_id = application.create_todo('Orders')
+        for i in range(250):
+            application.add_item(todo_id, str(i))
+        assert len(application.get_todo(todo_id).collect_items()) == 250
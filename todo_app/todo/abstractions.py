@@ -1,5 +1,9 @@
 import abc
-from typing import ContextManager
+from typing import (
+    ContextManager,
+    Iterable,
+    List,
+)
 from uuid import UUID
 
 from todo.domainmodel import Todo
@@ -18,6 +22,10 @@ class ITodoApp(abc.ABC):
     def add_item(self, todo_id: UUID, title: str):
         ...
 
+    @abc.abstractmethod
+    def add_items(self, todo_id: UUID, titles: Iterable[str]) -> List[UUID]:
+        ...
+
     @abc.abstractmethod
     def remove_item(self, todo_id: UUID, item_id: UUID):
         ...
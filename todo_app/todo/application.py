@@ -1,37 +1,84 @@
+from collections import OrderedDict
+from threading import Lock
 from typing import (
     Any,
+    Iterable,
     List,
+    Mapping,
 )
 from uuid import UUID
 
-from eventsourcing.application import (
-    Application,
-)
+from eventsourcing.application import Application
 from eventsourcing.domain import (
     MutableOrImmutableAggregate,
     DomainEventProtocol,
 )
 from eventsourcing.persistence import (
+    EventStore,
     IntegrityError,
     Mapper,
     Recording,
+    Transcoder,
 )
+from eventsourcing.utils import resolve_topic
 
+from seedwork.aio import AsyncApplication
+from seedwork.cache import CachingApplication
 from todo.abstractions import ITodoApp
 from todo.domainmodel import (
     Todo,
+    TodoDeltaSnapshot,
     project_todo,
 )
 from todo.seedwork import (
+    DeltaSnapshotStore,
     Snapshot,
 )
 from todo.mappers import PydanticMapper
 
 
-class TodoApp(ITodoApp, Application):
+class TodoMapping(Application):
+    """
+    Maps the events of todos with :class:`PydanticMapper`, and the transcoder of
+    TRANSCODER_TOPIC when it is set. Followers of TodoApp read its events with it.
+    """
+    TRANSCODER_TOPIC = 'TRANSCODER_TOPIC'
+
+    def construct_transcoder(self) -> Transcoder:
+        transcoder_topic = self.env.get(self.TRANSCODER_TOPIC)
+        if not transcoder_topic:
+            return super().construct_transcoder()
+        transcoder = resolve_topic(transcoder_topic)()
+        self.register_transcodings(transcoder)
+        return transcoder
+
+    def construct_mapper(self) -> Mapper:
+        return self.factory.mapper(
+            transcoder=self.construct_transcoder(),
+            mapper_class=PydanticMapper,
+        )
+
+
+class TodoApp(ITodoApp, TodoMapping, CachingApplication):
+    """
+    Snapshots of a todo are deltas of the items changed since its last full snapshot,
+    as long as the delta has at most DELTA_SNAPSHOT_RATIO (default 0.5) as many changes
+    as the full snapshot has items, then a full snapshot is taken again. The full
+    snapshots of the latest DELTA_SNAPSHOT_BASES todos are kept in memory to diff against.
+    """
+    DELTA_SNAPSHOT_RATIO = 'DELTA_SNAPSHOT_RATIO'
+    DELTA_SNAPSHOT_BASES = 1000
+
     is_snapshotting_enabled = True
+    snapshotting_intervals = {Todo: 100}
     snapshot_class = Snapshot
 
+    def __init__(self, env: Mapping[str, str] | None = None):
+        super().__init__(env)
+        self.delta_snapshot_ratio = float(self.env.get(self.DELTA_SNAPSHOT_RATIO, '0.5'))
+        self._snapshot_bases: OrderedDict[UUID, Todo] = OrderedDict()
+        self._snapshot_bases_lock = Lock()
+
     def create_todo(self, title: str) -> UUID:
         registered = Todo.create(title)
         try:
@@ -47,21 +94,32 @@ class TodoApp(ITodoApp, Application):
     def add_item(self, todo_id: UUID, title: str):
         todo: Todo = self.repository.get(todo_id, projector_func=project_todo)
         item_added = todo.add_item(title)
-        self.save(item_added)
+        self._save_todo(todo, item_added)
         return item_added.item.create_id()
 
+    def add_items(self, todo_id: UUID, titles: Iterable[str]) -> List[UUID]:
+        """
+        Adds the items with consecutive versions from one projection of the todo,
+        and saves them together. Returns the item ids in the order of the titles.
+        """
+        todo: Todo = self.repository.get(todo_id, projector_func=project_todo)
+        items_added = todo.add_items(titles)
+        if items_added:
+            self._save_todo(todo, *items_added)
+        return [item_added.item.create_id() for item_added in items_added]
+
     def remove_item(self, todo_id: UUID, item_id: UUID):
         todo = self.repository.get(todo_id, projector_func=project_todo)
-        self.save(todo.remove_item(item_id))
+        self._save_todo(todo, todo.remove_item(item_id))
 
     def done_item(self, todo_id: UUID, item_id: UUID):
         todo = self.repository.get(todo_id, projector_func=project_todo)
-        self.save(todo.mark_done(item_id))
+        self._save_todo(todo, todo.mark_done(item_id))
 
-    def construct_mapper(self) -> Mapper:
-        return self.factory.mapper(
-            transcoder=self.construct_transcoder(),
-            mapper_class=PydanticMapper,
+    def construct_snapshot_store(self) -> EventStore:
+        return DeltaSnapshotStore(
+            mapper=self.mapper,
+            recorder=self.factory.aggregate_recorder(purpose='snapshots'),
         )
 
     def save(
@@ -69,13 +127,67 @@ class TodoApp(ITodoApp, Application):
             *objs: MutableOrImmutableAggregate | DomainEventProtocol | None,
             **kwargs: Any,
     ) -> List[Recording]:
+        return self._save_todo(None, *objs, **kwargs)
+
+    def _save_todo(
+            self,
+            todo: Todo | None,
+            *objs: MutableOrImmutableAggregate | DomainEventProtocol | None,
+            **kwargs: Any,
+    ) -> List[Recording]:
+        """
+        Saves the events of todo. A snapshot due after them is taken from todo with
+        the events applied, so neither the command nor the snapshot replays the todo
+        from the store. With SNAPSHOTTING_IN_BACKGROUND the todo is projected and the
+        snapshot taken off the command path, the command only queues it.
+        """
         records = super().save(*objs, **kwargs)
-        snapshot_interval = 100
-        for record in records:
-            if record.domain_event.originator_version % snapshot_interval == 0:
-                self.take_snapshot(
-                    record.domain_event.originator_id,
-                    record.domain_event.originator_version,
-                    projector_func=project_todo
-                )
+        self.take_snapshots(
+            Todo,
+            records,
+            projector_func=project_todo,
+            get_state=None if todo is None else lambda todo_id: project_todo(todo, objs),
+        )
         return records
+
+    def take_snapshot(self, aggregate_id: UUID, version: int | None = None, projector_func: Any = project_todo) -> None:
+        self._put_snapshot(self.repository.get(aggregate_id, version=version, projector_func=projector_func))
+
+    def _put_snapshot(self, todo: Todo) -> None:
+        with self._snapshot_bases_lock:
+            base = self._snapshot_bases.get(todo.id)
+        snapshot: Snapshot | TodoDeltaSnapshot | None = None
+        if base is not None and base.version < todo.version:
+            snapshot = TodoDeltaSnapshot.take(todo, base)
+            if snapshot.changes > len(base.items) * self.delta_snapshot_ratio:
+                snapshot = None
+        if snapshot is not None:
+            self.snapshots.put([snapshot])
+            return
+        self.snapshots.put([Snapshot.take(todo)])
+        # Remembered once stored, so deltas only refer to stored full snapshots.
+        with self._snapshot_bases_lock:
+            self._snapshot_bases[todo.id] = todo
+            self._snapshot_bases.move_to_end(todo.id)
+            while len(self._snapshot_bases) > self.DELTA_SNAPSHOT_BASES:
+                self._snapshot_bases.popitem(last=False)
+
+
+class AsyncTodoApp(AsyncApplication[TodoApp]):
+    async def create_todo(self, title: str) -> UUID:
+        return await self.run(self.app.create_todo, title)
+
+    async def get_todo(self, todo_id: UUID) -> Todo:
+        return await self.run(self.app.get_todo, todo_id)
+
+    async def add_item(self, todo_id: UUID, title: str) -> UUID:
+        return await self.run(self.app.add_item, todo_id, title)
+
+    async def add_items(self, todo_id: UUID, titles: Iterable[str]) -> List[UUID]:
+        return await self.run(self.app.add_items, todo_id, list(titles))
+
+    async def remove_item(self, todo_id: UUID, item_id: UUID) -> None:
+        return await self.run(self.app.remove_item, todo_id, item_id)
+
+    async def done_item(self, todo_id: UUID, item_id: UUID) -> None:
+        return await self.run(self.app.done_item, todo_id, item_id)
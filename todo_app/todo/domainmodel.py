@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import datetime as dt
 from enum import Enum
 import typing as t
 from functools import (
@@ -15,12 +16,14 @@ from pydantic import (
     BaseModel,
     Field,
 )
+from eventsourcing.utils import get_topic
+
 from todo.seedwork import (
     DomainEvent,
     Aggregate,
+    DeltaSnapshot,
     Snapshot,
     create_timestamp,
-    aggregate_projector,
 )
 
 
@@ -88,6 +91,18 @@ class Todo(Aggregate):
             item=Item(title=title, status=ItemStatus.CREATED),
         )
 
+    def add_items(self, titles: t.Iterable[str]) -> list[ItemAdded]:
+        timestamp = create_timestamp()
+        return [
+            ItemAdded(
+                originator_id=self.id,
+                originator_version=self.version + position,
+                timestamp=timestamp,
+                item=Item(title=title, status=ItemStatus.CREATED),
+            )
+            for position, title in enumerate(titles, 1)
+        ]
+
     def remove_item(self, item_id: UUID) -> ItemRemoved:
         return ItemRemoved(
             originator_id=self.id,
@@ -105,14 +120,105 @@ class Todo(Aggregate):
         )
 
 
+class TodoDelta(BaseModel):
+    id: UUID
+    version: int
+    created_on: dt.datetime
+    modified_on: dt.datetime
+    title: str
+    items: dict[UUID, Item] = Field(default_factory=dict)
+    removed: list[UUID] = Field(default_factory=list)
+
+
+class TodoDeltaSnapshot(DeltaSnapshot):
+    """
+    The items added or changed and the ids of the items removed since the base Todo.
+    """
+
+    @classmethod
+    def take(cls, aggregate: Todo, base: Todo | None = None) -> TodoDeltaSnapshot:
+        assert base is not None
+        delta = TodoDelta(
+            id=aggregate.id,
+            version=aggregate.version,
+            created_on=aggregate.created_on,
+            modified_on=aggregate.modified_on,
+            title=aggregate.title,
+            # Unchanged items are usually shared with the base, so identity is checked first.
+            items={
+                item_id: item
+                for item_id, item in aggregate.items.items()
+                if base.items.get(item_id) is not item and base.items.get(item_id) != item
+            },
+            removed=[item_id for item_id in base.items if item_id not in aggregate.items],
+        )
+        return cls(
+            originator_id=aggregate.id,
+            originator_version=aggregate.version,
+            timestamp=create_timestamp(),
+            topic=get_topic(Todo),
+            state=delta.model_dump(),
+            base_version=base.version,
+        )
+
+    @property
+    def changes(self) -> int:
+        return len(self.state['items']) + len(self.state['removed'])
+
+
+class TodoBuilder:
+    """
+    Mutable working copy of a Todo. Events are applied to it in place while
+    a stream is replayed, and the frozen Todo is built once at the end.
+    """
+
+    def __init__(
+            self,
+            id: UUID,
+            version: int,
+            created_on: dt.datetime,
+            modified_on: dt.datetime,
+            title: str,
+            items: dict[UUID, Item] | None = None,
+    ):
+        self.id = id
+        self.version = version
+        self.created_on = created_on
+        self.modified_on = modified_on
+        self.title = title
+        self.items = items if items is not None else {}
+
+    @classmethod
+    def from_todo(cls, todo: Todo) -> TodoBuilder:
+        return cls(
+            id=todo.id,
+            version=todo.version,
+            created_on=todo.created_on,
+            modified_on=todo.modified_on,
+            title=todo.title,
+            items=dict(todo.items),
+        )
+
+    def build(self) -> Todo:
+        # Every value here comes from a validated event or Todo.
+        return Todo.model_construct(
+            id=self.id,
+            version=self.version,
+            created_on=self.created_on,
+            modified_on=self.modified_on,
+            title=self.title,
+            items=self.items,
+        )
+
+
 @singledispatch
-def mutate(event: DomainEvent, aggregate: Todo | None) -> Todo:
+def apply(event: DomainEvent, builder: TodoBuilder | None) -> TodoBuilder | None:
     ...
 
 
-@mutate.register
-def _(event: Created, _: None) -> Todo:
-    return Todo(
+@apply.register
+def _(event: Created, _: None) -> TodoBuilder:
+    return TodoBuilder(
         id=event.originator_id,
         version=event.originator_version,
         created_on=event.timestamp,
@@ -121,58 +227,67 @@ def _(event: Created, _: None) -> Todo:
     )
 
 
-@mutate.register
-def _(event: ItemAdded, todo: Todo) -> Todo:
-    todo = Todo(
-        id=todo.id,
-        version=event.originator_version,
-        created_on=todo.created_on,
-        modified_on=event.timestamp,
-        title=todo.title,
-        items=todo.items | {event.item.create_id(): event.item}
-    )
-    return todo
+@apply.register
+def _(event: ItemAdded, builder: TodoBuilder) -> TodoBuilder:
+    builder.items[event.item.create_id()] = event.item
+    builder.version = event.originator_version
+    builder.modified_on = event.timestamp
+    return builder
 
 
-@mutate.register
-def _(event: ItemRemoved, todo: Todo) -> Todo:
-    todo = Todo(
-        id=todo.id,
-        version=event.originator_version,
-        created_on=todo.created_on,
-        modified_on=event.timestamp,
-        title=todo.title,
-        items=todo.items,
-    )
-    if event.item_id in todo.items:
-        todo.items.pop(event.item_id)
-    return todo
+@apply.register
+def _(event: ItemRemoved, builder: TodoBuilder) -> TodoBuilder:
+    builder.items.pop(event.item_id, None)
+    builder.version = event.originator_version
+    builder.modified_on = event.timestamp
+    return builder
 
 
-@mutate.register
-def _(event: ItemMarkedDown, todo: Todo) -> Todo:
-    todo = Todo(
-        id=todo.id,
-        version=event.originator_version,
-        created_on=todo.created_on,
-        modified_on=event.timestamp,
-        title=todo.title,
-        items=todo.items,
-    )
-    todo.items[event.item_id].mark_done()
-    return todo
+@apply.register
+def _(event: ItemMarkedDown, builder: TodoBuilder) -> TodoBuilder:
+    # Items are shared with events and earlier Todo objects, so copy before changing.
+    item = builder.items[event.item_id].model_copy()
+    item.mark_done()
+    builder.items[event.item_id] = item
+    builder.version = event.originator_version
+    builder.modified_on = event.timestamp
+    return builder
 
 
-@mutate.register
-def _(event: Snapshot, _: None):
-    return Todo(
+@apply.register
+def _(event: Snapshot, _: None) -> TodoBuilder:
+    todo = Todo(
         id=event.state["id"],
-        version=event.state["originator_version"],
+        version=event.originator_version,
         created_on=event.state["created_on"],
         modified_on=event.state["modified_on"],
         title=event.state["title"],
         items=event.state["items"],
     )
+    return TodoBuilder.from_todo(todo)
+
+
+@apply.register
+def _(event: TodoDeltaSnapshot, _: None) -> TodoBuilder:
+    if event.base is None:
+        raise ValueError(f'Base snapshot {event.base_version} of {event.originator_id} is not loaded')
+    builder = apply(event.base, None)
+    delta = TodoDelta.model_validate(event.state)
+    for item_id in delta.removed:
+        builder.items.pop(item_id, None)
+    builder.items.update(delta.items)
+    builder.version = event.originator_version
+    builder.modified_on = delta.modified_on
+    builder.title = delta.title
+    return builder
+
+
+def project_todo(todo: Todo | None, events: t.Iterable[DomainEvent]) -> Todo | None:
+    builder = TodoBuilder.from_todo(todo) if todo is not None else None
+    for event in events:
+        builder = apply(event, builder)
+    return builder.build() if builder is not None else None
 
 
-project_todo = aggregate_projector(mutate)
+def mutate(event: DomainEvent, todo: Todo | None) -> Todo | None:
+    return project_todo(todo, [event])
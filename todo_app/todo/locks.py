@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import zlib
+from time import perf_counter
+from typing import Any
+
+from todo.abstractions import ILock
+
+
+class LockStats:
+    """
+    Counts the acquisitions of a lock, how many had to wait for another holder,
+    and the time spent waiting for and holding the lock.
+    """
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.hold_seconds = 0.0
+        self.max_hold_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, contended: bool, waited: float, held: float) -> None:
+        with self._lock:
+            self.acquired += 1
+            self.contended += contended
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.hold_seconds += held
+            self.max_hold_seconds = max(self.max_hold_seconds, held)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'hold_seconds': self.hold_seconds,
+                'max_hold_seconds': self.max_hold_seconds,
+            }
+
+
+class _Held:
+    __slots__ = ('_lock', '_stripe', '_contended', '_waited', '_acquired_at')
+
+    def __init__(self, lock: StripedLock, key: Any):
+        self._lock = lock
+        self._stripe = lock.get_stripe(key)
+
+    def __enter__(self) -> _Held:
+        started = perf_counter()
+        self._contended = self._lock.acquire(self._stripe)
+        self._acquired_at = perf_counter()
+        self._waited = self._acquired_at - started
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        held = perf_counter() - self._acquired_at
+        self._lock.release(self._stripe)
+        self._lock.stats.record(self._contended, self._waited, held)
+
+
+class StripedLock(ILock):
+    """
+    In-process lock by key. Keys are spread over a fixed table of stripes by a
+    stable hash, so memory is bounded whatever the number of keys, and keys which
+    share a stripe share its lock. Stripes are reentrant, so a thread holding one
+    key can take another key of the same stripe.
+
+    lock(key) is a context manager, the lock itself locks the key None.
+    """
+
+    def __init__(self, stripes: int = 1024):
+        self.stripes = stripes
+        self.stats = LockStats()
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._local = threading.local()
+
+    def __call__(self, __lock_key: Any = None) -> _Held:
+        return _Held(self, __lock_key)
+
+    def __enter__(self) -> StripedLock:
+        held = _Held(self, None)
+        self._local.__dict__.setdefault('held', []).append(held)
+        held.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._local.held.pop().__exit__(*exc_info)
+
+    def get_stripe(self, key: Any) -> int:
+        # hash() of str is salted per process, crc32 is the same in every process.
+        return zlib.crc32(str(key).encode('utf8')) % self.stripes
+
+    def acquire(self, stripe: int) -> bool:
+        """
+        Acquires the stripe, tells if it had to wait for another holder.
+        """
+        lock = self._locks[stripe]
+        if lock.acquire(blocking=False):
+            return False
+        lock.acquire()
+        return True
+
+    def release(self, stripe: int) -> None:
+        self._locks[stripe].release()
+
+
+class FileLock(StripedLock):
+    """
+    Lock by key shared by the processes of one host, through flock() on one file
+    per stripe in directory. Within a process the threads are serialised on the
+    stripes of :class:`StripedLock` first, and the file is locked by the outermost
+    holder only.
+    """
+
+    def __init__(self, directory: str, stripes: int = 256):
+        super().__init__(stripes)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._files: dict[int, int] = {}
+        self._files_lock = threading.Lock()
+        self._depths = [0] * stripes
+
+    def acquire(self, stripe: int) -> bool:
+        contended = super().acquire(stripe)
+        self._depths[stripe] += 1
+        if self._depths[stripe] > 1:
+            return contended
+        fd = self._get_file(stripe)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                contended = True
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._depths[stripe] -= 1
+            super().release(stripe)
+            raise
+        return contended
+
+    def release(self, stripe: int) -> None:
+        self._depths[stripe] -= 1
+        if not self._depths[stripe]:
+            fcntl.flock(self._files[stripe], fcntl.LOCK_UN)
+        super().release(stripe)
+
+    def close(self) -> None:
+        with self._files_lock:
+            while self._files:
+                os.close(self._files.popitem()[1])
+
+    def _get_file(self, stripe: int) -> int:
+        try:
+            return self._files[stripe]
+        except KeyError:
+            pass
+        with self._files_lock:
+            if stripe not in self._files:
+                self._files[stripe] = os.open(
+                    os.path.join(self.directory, f'lock-{stripe}'), os.O_RDWR | os.O_CREAT, 0o644
+                )
+            return self._files[stripe]
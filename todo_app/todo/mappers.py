@@ -5,18 +5,41 @@ from typing import Any, Dict, cast
 from pydantic import BaseModel
 
 from eventsourcing.persistence import (
+    JSONTranscoder,
     Mapper,
     StoredEvent,
+    Transcoder,
 )
 from eventsourcing.utils import get_topic, resolve_topic
 from eventsourcing.domain import DomainEventProtocol
+from eventsourcing.cipher import Cipher
+from eventsourcing.compressor import Compressor
 
 
 class PydanticMapper(Mapper):
+    """
+    With a JSON transcoder the event state goes straight between the model and bytes
+    through the compiled pydantic serializer and validator, without building an
+    intermediate dict. Other transcoders get the model dump with python types, so
+    binary transcoders can pack UUID and datetime values natively.
+    """
+
+    def __init__(
+            self,
+            transcoder: Transcoder,
+            compressor: Compressor | None = None,
+            cipher: Cipher | None = None,
+    ):
+        super().__init__(transcoder, compressor=compressor, cipher=cipher)
+        self.is_json = isinstance(transcoder, JSONTranscoder)
+
     def to_stored_event(self, domain_event: DomainEventProtocol) -> StoredEvent:
         topic = get_topic(domain_event.__class__)
-        event_state = cast(BaseModel, domain_event).model_dump(mode='json')
-        stored_state = self.transcoder.encode(event_state)
+        if self.is_json:
+            stored_state = cast(BaseModel, domain_event).model_dump_json().encode('utf8')
+        else:
+            event_state = cast(BaseModel, domain_event).model_dump()
+            stored_state = self.transcoder.encode(event_state)
         if self.compressor:
             stored_state = self.compressor.compress(stored_state)
         if self.cipher:
@@ -34,6 +57,8 @@ class PydanticMapper(Mapper):
             stored_state = self.cipher.decrypt(stored_state)
         if self.compressor:
             stored_state = self.compressor.decompress(stored_state)
-        event_state: Dict[str, Any] = self.transcoder.decode(stored_state)
         cls = resolve_topic(stored.topic)
+        if self.is_json:
+            return cls.model_validate_json(stored_state)
+        event_state: Dict[str, Any] = self.transcoder.decode(stored_state)
         return cls(**event_state)
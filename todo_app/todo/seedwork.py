@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import abc
 import datetime as dt
 import typing as t
 from uuid import UUID
 
+from eventsourcing.domain import DomainEventProtocol
+from eventsourcing.persistence import EventStore
 from eventsourcing.utils import get_topic
-from pydantic import BaseModel
+from pydantic import (
+    BaseModel,
+    Field,
+)
 
 
 class DomainEvent(BaseModel):
@@ -60,6 +66,40 @@ class Snapshot(BaseModel):
         )
 
 
+class DeltaSnapshot(BaseModel, abc.ABC):
+    """
+    Snapshot of the changes since the full snapshot at base_version. It is not
+    stored with its base, the snapshot store attaches the base when reading it.
+    """
+    topic: str
+    state: dict[str, t.Any]
+    originator_id: UUID
+    originator_version: int
+    timestamp: dt.datetime
+    base_version: int
+    base: Snapshot | DeltaSnapshot | None = Field(default=None, exclude=True)
+
+    @classmethod
+    @abc.abstractmethod
+    def take(cls, aggregate: Aggregate, base: Aggregate | None = None) -> DeltaSnapshot:
+        ...
+
+
+class DeltaSnapshotStore(EventStore):
+    """
+    Snapshot store which reads the base snapshot of every delta snapshot it returns.
+    """
+
+    def get(self, originator_id: UUID, **kwargs: t.Any) -> t.Iterator[DomainEventProtocol]:
+        for snapshot in super().get(originator_id, **kwargs):
+            if isinstance(snapshot, DeltaSnapshot) and snapshot.base is None:
+                snapshot.base = next(
+                    self.get(originator_id, gt=snapshot.base_version - 1, lte=snapshot.base_version),
+                    None,
+                )
+            yield snapshot
+
+
 def create_timestamp() -> dt.datetime:
     return dt.datetime.now(tz=dt.timezone.utc)
 
@@ -1,12 +1,28 @@
+import random
+import threading
 from functools import singledispatchmethod
+from time import sleep
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    TypeVar,
+)
 from uuid import UUID
 
+from eventsourcing.persistence import IntegrityError
+
 from todo.abstractions import (
     ITodoApp,
     ILock,
 )
+from todo.locks import StripedLock
 from todo.seedwork import DomainCommand
 
+T = TypeVar('T')
+
 
 class CreateTodoCmd(DomainCommand):
     title: str
@@ -17,24 +33,104 @@ class AddItemCmd(DomainCommand):
     title: str
 
 
+class RetryPolicy:
+    """
+    Runs a command until it is saved without a version conflict, at most attempts
+    times. Before a retry it sleeps a random time up to base_delay * 2 ** retry
+    seconds, capped at max_delay, so that conflicting writers spread out.
+    """
+
+    def __init__(self, attempts: int = 10, base_delay: float = 0.001, max_delay: float = 0.05):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.conflicts = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        for retry in range(self.attempts):
+            try:
+                return func(*args, **kwargs)
+            except IntegrityError:
+                with self._lock:
+                    self.conflicts += 1
+                    if retry == self.attempts - 1:
+                        self.exhausted += 1
+                        raise
+            sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry)))
+        raise AssertionError('attempts must be positive')
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'conflicts': self.conflicts, 'exhausted': self.exhausted}
+
+
 class TodoService:
-    def __init__(self, todo_app: ITodoApp, lock: ILock):
+    """
+    Commands on a todo are serialised on the lock, or with a retry policy they
+    run without it and are retried when another writer saved the todo first.
+    """
+
+    def __init__(self, todo_app: ITodoApp, lock: ILock | None = None, retry: RetryPolicy | None = None):
         self._todo = todo_app
-        self._lock = lock
+        self._lock = lock if lock is not None else StripedLock()
+        self._retry = retry
 
     @singledispatchmethod
     def handle(self, command: DomainCommand, *args, **kwargs):
         ...
 
+    def handle_many(self, commands: Iterable[DomainCommand]) -> List[Any]:
+        """
+        Handles the commands in order, except that every run of AddItemCmd is grouped
+        by todo, and each group is handled as one command: one lock, one projection
+        and one save. Returns the results in the order of the commands, a command
+        which failed has its exception in place of the result.
+        """
+        commands = list(commands)
+        results: List[Any] = [None] * len(commands)
+        pending: Dict[UUID, List[int]] = {}
+        for position, command in enumerate(commands):
+            if isinstance(command, AddItemCmd):
+                pending.setdefault(command.todo_id, []).append(position)
+                continue
+            self._add_items(commands, pending, results)
+            try:
+                results[position] = self.handle(command)
+            except Exception as error:
+                results[position] = error
+        self._add_items(commands, pending, results)
+        return results
+
     @handle.register
     def _(self, command: CreateTodoCmd):
+        # create_todo resolves its own conflicts.
+        if self._retry is not None:
+            return self._todo.create_todo(command.title)
         with self._lock(f'todo-{command.title}'):
             todo_id = self._todo.create_todo(command.title)
         return todo_id
 
     @handle.register
     def _(self, command: AddItemCmd):
+        if self._retry is not None:
+            return self._retry(self._todo.add_item, command.todo_id, title=command.title)
         with self._lock(f'todo-{command.todo_id}'):
             item_id = self._todo.add_item(command.todo_id, title=command.title)
         return item_id
 
+    def _add_items(self, commands: List[Any], pending: Dict[UUID, List[int]], results: List[Any]) -> None:
+        for todo_id, positions in pending.items():
+            titles = [commands[position].title for position in positions]
+            try:
+                if self._retry is not None:
+                    item_ids = self._retry(self._todo.add_items, todo_id, titles)
+                else:
+                    with self._lock(f'todo-{todo_id}'):
+                        item_ids = self._todo.add_items(todo_id, titles)
+            except Exception as error:
+                item_ids = [error] * len(positions)
+            for position, item_id in zip(positions, item_ids):
+                results[position] = item_id
+        pending.clear()
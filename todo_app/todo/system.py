@@ -0,0 +1,201 @@
+from functools import singledispatchmethod
+from uuid import UUID
+
+import sqlalchemy as sa
+from eventsourcing.application import ProcessingEvent
+from eventsourcing.domain import DomainEventProtocol
+from eventsourcing.persistence import Tracking
+from eventsourcing.utils import strtobool
+from sqlalchemy import Engine
+
+from seedwork.batching import BatchingFollower
+from todo.application import TodoMapping
+from todo.domainmodel import (
+    Created,
+    Item,
+    ItemAdded,
+    ItemMarkedDown,
+    ItemRemoved,
+    ItemStatus,
+)
+
+metadata = sa.MetaData()
+
+todos = sa.Table(
+    'todos',
+    metadata,
+    sa.Column('todo_id', sa.String(36), primary_key=True),
+    sa.Column('title', sa.Text, nullable=False),
+    sa.Column('version', sa.Integer, nullable=False),
+    sa.Column('created', sa.Integer, nullable=False, server_default='0'),
+    sa.Column('done', sa.Integer, nullable=False, server_default='0'),
+)
+
+todo_items = sa.Table(
+    'todo_items',
+    metadata,
+    sa.Column('todo_id', sa.String(36), primary_key=True),
+    sa.Column('item_id', sa.String(36), primary_key=True),
+    sa.Column('title', sa.Text, nullable=False),
+    sa.Column('status', sa.String(16), nullable=False),
+    sa.Index('todo_items_status', 'status', 'todo_id'),
+    sa.Index('todo_items_todo_status', 'todo_id', 'status'),
+)
+
+
+class TodoMaterialize(TodoMapping, BatchingFollower):
+    """
+    Denormalized view of the todos of TodoApp: one todo_items row per item, indexed
+    by status, and one todos row per todo holding its item counts by status.
+
+    A batch is written in one transaction with one final change per item. Every
+    write is idempotent, so a batch written again after a crash gives the same rows.
+    The tables are created unless TODO_MATERIALIZE_CREATE_TABLE is off.
+    """
+    TODO_MATERIALIZE_CREATE_TABLE = 'TODO_MATERIALIZE_CREATE_TABLE'
+
+    _insert_todos = sa.text(
+        """
+        INSERT INTO todos (todo_id, title, version, created, done)
+        VALUES (:todo_id, :title, :version, 0, 0)
+        ON CONFLICT (todo_id) DO NOTHING
+        """
+    )
+    _upsert_items = sa.text(
+        """
+        INSERT INTO todo_items (todo_id, item_id, title, status)
+        VALUES (:todo_id, :item_id, :title, :status)
+        ON CONFLICT (todo_id, item_id) DO UPDATE
+        SET title = EXCLUDED.title, status = EXCLUDED.status
+        """
+    )
+    _update_items = sa.text(
+        "UPDATE todo_items SET status = :status WHERE todo_id = :todo_id AND item_id = :item_id"
+    )
+    _delete_items = sa.text("DELETE FROM todo_items WHERE todo_id = :todo_id AND item_id = :item_id")
+    # Counted again over the index of the todo rather than incremented, so replays do not count twice.
+    _update_counts = sa.text(
+        """
+        UPDATE todos SET
+            version = :version,
+            created = (SELECT COUNT(*) FROM todo_items WHERE todo_id = :todo_id AND status = 'CREATED'),
+            done = (SELECT COUNT(*) FROM todo_items WHERE todo_id = :todo_id AND status = 'DONE')
+        WHERE todo_id = :todo_id
+        """
+    )
+
+    def __init__(self, env: dict):
+        self.engine: Engine = env['postgresql_engine']
+        super().__init__(env)
+        self._todos: dict[str, dict] = {}
+        self._versions: dict[str, int] = {}
+        self._items: dict[tuple[str, str], tuple[str, dict]] = {}
+        if strtobool(self.env.get(self.TODO_MATERIALIZE_CREATE_TABLE) or 'yes'):
+            metadata.create_all(self.engine)
+
+    def process_event(self, domain_event: DomainEventProtocol, tracking: Tracking) -> None:
+        with self.processing_lock:
+            self._versions[str(domain_event.originator_id)] = domain_event.originator_version
+            super().process_event(domain_event, tracking)
+
+    def write_batch(self, processing_event: ProcessingEvent) -> None:
+        todo_rows, versions, items = self._todos, self._versions, self._items
+        self._todos, self._versions, self._items = {}, {}, {}
+        changes: dict[str, list[dict]] = {'upsert': [], 'update': [], 'delete': []}
+        for change, row in items.values():
+            changes[change].append(row)
+        with self.engine.begin() as conn:
+            for statement, rows in (
+                    (self._insert_todos, list(todo_rows.values())),
+                    (self._delete_items, changes['delete']),
+                    (self._upsert_items, changes['upsert']),
+                    (self._update_items, changes['update']),
+                    (
+                        self._update_counts,
+                        [{'todo_id': todo_id, 'version': version} for todo_id, version in versions.items()],
+                    ),
+            ):
+                if rows:
+                    conn.execute(statement, rows)
+
+    def get_todo_ids(self, status: ItemStatus = ItemStatus.CREATED, limit: int | None = None) -> list[UUID]:
+        """
+        The todos with items in status, for example the todos with undone items,
+        read from the status index.
+        """
+        statement = (
+            sa.select(todo_items.c.todo_id)
+            .where(todo_items.c.status == status.value)
+            .distinct()
+            .order_by(todo_items.c.todo_id)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            return [UUID(todo_id) for todo_id in conn.execute(statement).scalars()]
+
+    def get_items(self, todo_id: UUID, status: ItemStatus | None = None) -> dict[UUID, Item]:
+        statement = sa.select(todo_items.c.item_id, todo_items.c.title, todo_items.c.status).where(
+            todo_items.c.todo_id == str(todo_id)
+        )
+        if status is not None:
+            statement = statement.where(todo_items.c.status == status.value)
+        with self.engine.connect() as conn:
+            return {
+                UUID(item_id): Item(title=title, status=item_status)
+                for item_id, title, item_status in conn.execute(statement)
+            }
+
+    def count_items(self, todo_id: UUID) -> dict[ItemStatus, int] | None:
+        """
+        The item counts of the todo by status, from its one todos row.
+        """
+        statement = sa.select(todos.c.created, todos.c.done).where(todos.c.todo_id == str(todo_id))
+        with self.engine.connect() as conn:
+            row = conn.execute(statement).first()
+        if row is None:
+            return None
+        return {ItemStatus.CREATED: row.created, ItemStatus.DONE: row.done}
+
+    def count_todos(self, status: ItemStatus = ItemStatus.CREATED) -> int:
+        statement = sa.select(sa.func.count(sa.distinct(todo_items.c.todo_id))).where(
+            todo_items.c.status == status.value
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(statement).scalar_one()
+
+    @singledispatchmethod
+    def policy(self, domain_event: DomainEventProtocol, processing_event: ProcessingEvent) -> None:
+        ...
+
+    @policy.register
+    def _(self, domain_event: Created, processing_event: ProcessingEvent) -> None:
+        todo_id = str(domain_event.originator_id)
+        self._todos[todo_id] = {
+            'todo_id': todo_id,
+            'title': domain_event.title,
+            'version': domain_event.originator_version,
+        }
+
+    @policy.register
+    def _(self, domain_event: ItemAdded, processing_event: ProcessingEvent) -> None:
+        row = self._get_item_row(domain_event.originator_id, domain_event.item.create_id())
+        row.update(title=domain_event.item.title, status=ItemStatus(domain_event.item.status).value)
+        self._items[row['todo_id'], row['item_id']] = ('upsert', row)
+
+    @policy.register
+    def _(self, domain_event: ItemRemoved, processing_event: ProcessingEvent) -> None:
+        row = self._get_item_row(domain_event.originator_id, domain_event.item_id)
+        self._items[row['todo_id'], row['item_id']] = ('delete', row)
+
+    @policy.register
+    def _(self, domain_event: ItemMarkedDown, processing_event: ProcessingEvent) -> None:
+        key = (str(domain_event.originator_id), str(domain_event.item_id))
+        change, row = self._items.get(key, ('update', self._get_item_row(*key)))
+        if change == 'delete':
+            return
+        row['status'] = ItemStatus.DONE.value
+        self._items[key] = (change, row)
+
+    def _get_item_row(self, todo_id: UUID | str, item_id: UUID | str) -> dict:
+        key = (str(todo_id), str(item_id))
+        return dict(self._items.get(key, ('', {}))[1], todo_id=key[0], item_id=key[1])
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import datetime as dt
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+import msgpack
+from eventsourcing.persistence import Transcoder
+from eventsourcing.utils import (
+    get_topic,
+    resolve_topic,
+)
+
+UUID_CODE = 1
+DATETIME_CODE = 2
+ENUM_CODE = 3
+TRANSCODING_CODE = 4
+
+
+class MsgpackTranscoder(Transcoder):
+    """
+    Compact binary transcoder. UUID, datetime and enum values are packed as
+    msgpack extension types, other types use the registered transcodings.
+    """
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=self._encode_obj)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._decode_obj, strict_map_key=False)
+
+    def _encode_obj(self, o: Any) -> msgpack.ExtType:
+        if isinstance(o, UUID):
+            return msgpack.ExtType(UUID_CODE, o.bytes)
+        if isinstance(o, dt.datetime):
+            return msgpack.ExtType(DATETIME_CODE, o.isoformat().encode('utf8'))
+        if isinstance(o, Enum):
+            return msgpack.ExtType(ENUM_CODE, self.encode([get_topic(type(o)), o.value]))
+        try:
+            transcoding = self.types[type(o)]
+        except KeyError:
+            raise TypeError(
+                f"Object of type {type(o)} is not serializable. "
+                "Please define and register a custom transcoding for this type."
+            ) from None
+        return msgpack.ExtType(TRANSCODING_CODE, self.encode([transcoding.name, transcoding.encode(o)]))
+
+    def _decode_obj(self, code: int, data: bytes) -> Any:
+        if code == UUID_CODE:
+            return UUID(bytes=data)
+        if code == DATETIME_CODE:
+            return dt.datetime.fromisoformat(data.decode('utf8'))
+        if code == ENUM_CODE:
+            topic, value = self.decode(data)
+            return resolve_topic(topic)(value)
+        if code == TRANSCODING_CODE:
+            name, value = self.decode(data)
+            return self.names[name].decode(value)
+        return msgpack.ExtType(code, data)